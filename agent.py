@@ -1,17 +1,33 @@
 import torch as T
-import random
 import numpy as np
 from game import Minesweeper
-from collections import deque
-import pygame
-from sprites import load_images
-from dqn import Linear_QNet, QTrainer
-from plot_helper import plot
+from replay import ReplayBuffer, PrioritizedReplayBuffer
+from encoding import encode_states, NUM_CHANNELS
+from dqn import Linear_QNet, Conv_QNet, QTrainer
+import os
 import time
+from metrics import MetricsLogger, launch_viewer
+from profiler import DISABLED, PhaseTimer, Trace
 
 
 class Agent:
-    def __init__(self, eps_start, eps_end, gamma, max_mem, batch_size, lr, n):
+    def __init__(
+        self,
+        eps_start,
+        eps_end,
+        gamma,
+        max_mem,
+        batch_size,
+        lr,
+        n,
+        prioritized=False,
+        network="linear",
+        encoding="raw",
+        timer=DISABLED,
+        double=True,
+        dueling=False,
+        tau=0.005,
+    ):
         """
         Create an RL Agent
         Args:
@@ -22,6 +38,18 @@ class Agent:
             batch_size - size of training batches
             lr - the learning rate
             n - the size of the board (lengthwise)
+            prioritized - T/F if replay memory is sampled by TD error
+            network - 'linear' for Linear_QNet, or 'conv' for Conv_QNet,
+            which works on any board size
+            encoding - 'raw' to feed the board values to the network, or
+            'onehot' for one channel per square type, see encoding.py
+            timer - PhaseTimer the trainer times its stages with, see
+            profiler.py
+            double - T/F if targets use Double DQN, see QTrainer
+            dueling - T/F if the network uses a dueling value/advantage
+            head, off by default so saved models still load
+            tau - soft target update rate, None copies the target network
+            every 50 steps instead
         """
         self.n_games = 0
         self.eps_start = eps_start
@@ -30,14 +58,45 @@ class Agent:
         self.decay_factor = 0.00005
         self.gamma = gamma  # discount factor
         self.max_mem = max_mem
-        self.memory = deque(maxlen=self.max_mem)
         self.batch_size = batch_size
         self.lr = lr
         self.n = n
-        self.model = Linear_QNet(n**2, 128, 128, n**2)
-        target = Linear_QNet(n**2, 128, 128, n**2)
-        self.trainer = QTrainer(self.model, target, lr, self.gamma, 50)
-        self.action_space = np.array([i for i in range(n**2)], dtype=int)
+        self.network = network
+        self.encoding = encoding
+        self.dueling = dueling
+        self.channels = NUM_CHANNELS if encoding == "onehot" else 1
+        self.model = self.build_model()
+        target = self.build_model()
+        self.trainer = QTrainer(
+            self.model, target, lr, self.gamma, 50, timer, double=double, tau=tau
+        )
+        self.prioritized = prioritized
+
+        # one-hot states are stored as booleans, raw boards fit in int8
+        if network == "conv":
+            state_shape = (self.channels, n, n)
+        else:
+            state_shape = (self.channels * n**2,)
+        state_dtype = bool if encoding == "onehot" else np.int8
+        memory_type = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+        self.memory = memory_type(
+            self.max_mem, state_shape, self.model.device, state_dtype=state_dtype
+        )
+
+    def build_model(self):
+        """
+        Create a fresh Q-network of the agent's network type
+        Args:
+            None
+        Returns:
+            The network
+        """
+        if self.network == "conv":
+            return Conv_QNet(self.channels, 64, 4, dueling=self.dueling)
+        if self.network == "linear":
+            size = self.channels * self.n**2
+            return Linear_QNet(size, 128, 128, self.n**2, dueling=self.dueling)
+        raise ValueError(f"Unknown network type: {self.network}")
 
     def get_state(self, game):
         """
@@ -45,15 +104,22 @@ class Agent:
         Args:
             game - the game instance
         Returns:
-            The state of the board, represented as a flattened matrix
+            The state of the board, represented as a flattened matrix for
+            Linear_QNet, or as a channels-first (C, n, n) board for Conv_QNet
         """
-        state = np.array(game.board)
-        state = state.flatten("F")
-        return np.where(state == -3, -1, state)  # obscure mine positions to the agent
+        if self.encoding == "onehot":
+            state = encode_states(game.board)  # mines are already obscured
+            return state if self.network == "conv" else state.reshape(-1)
+
+        # obscure mine positions to the agent
+        state = np.where(game.board == -3, -1, game.board)
+        if self.network == "conv":
+            return state[np.newaxis]
+        return state.flatten("F")
 
     def remember(self, state, action, reward, next_state, done):
         """
-        Add an episode to the deque
+        Add an episode to the replay memory
         Args:
             state - the current state
             action - the action taken at 'state'
@@ -63,27 +129,46 @@ class Agent:
         Returns:
             Nothing
         """
-        self.memory.append((state, action, reward, next_state, done))  # popleft if full
+        self.memory.add(state, action, reward, next_state, done)  # overwrite if full
 
-    def train_long_memory(self):
+    def train_batch(self):
         """
-        Train the agent over an entire training batch
+        Take one gradient step on a mini-batch sampled from replay memory
         Args:
             None
         Returns
-            Nothing
+            The TD error of every sample in the batch, as a detached tensor
         """
-        if len(self.memory) > self.batch_size:
-            mini_sample = random.sample(self.memory, self.batch_size)
+        # takes entire replay memory if we have less than self.batch_size memories
+        if self.prioritized:
+            batch, idx = self.memory.sample(self.batch_size)
+            td_errors = self.trainer.train_step(*batch)
+            self.memory.update_priorities(idx, td_errors.cpu().numpy())
         else:
-            mini_sample = (
-                self.memory
-            )  # take entire replay memory if we have less than self.batch_size memories
+            batch = self.memory.sample(self.batch_size)
+            td_errors = self.trainer.train_step(*batch)
+        return td_errors
 
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+    def train_long_memory(self):
+        """
+        Train the agent over an entire training batch at the end of a game
+        Args:
+            None
+        Returns
+            The TD error of every sample in the batch, as a detached tensor
+        """
+        td_errors = self.train_batch()
+        self.decay_epsilon()
+        return td_errors
 
-        # reduce epsilon
+    def decay_epsilon(self):
+        """
+        Reduce the exploration rate after a game
+        Args:
+            None
+        Returns:
+            Nothing
+        """
         # self.epsilon = max(self.epsilon * self.decay_factor, self.eps_end)
         self.epsilon = max(self.epsilon - self.decay_factor, self.eps_end)
 
@@ -110,38 +195,105 @@ class Agent:
         Returns:
             The action the agent chose (integer representing the index of the square to click)
         """
+        mask = game.action_mask()  # getting rid of 'useless' moves
         if np.random.random() < self.epsilon:  # explorative factor
-            temp = self.action_space
-            for j, i in enumerate(temp):  # getting rid of 'useless' moves
-                x = j // game.n
-                y = j % game.n
-                if game.board[x][y] in {0, 1, 2, 3, 4, 5, 6, 7, 8}:
-                    temp = temp[temp != j]
-            action = np.random.choice(temp)
+            action = np.random.choice(np.flatnonzero(mask))
         else:
-            state0 = T.tensor(state, dtype=T.float)  # else, pick off of policy
-            prediction = self.model(state0)
-
-            temp = prediction.tolist()
-            for j, i in enumerate(temp):  # getting rid of 'useless' moves
-                x = j // game.n
-                y = j % game.n
-                if game.board[x][y] in {0, 1, 2, 3, 4, 5, 6, 7, 8}:
-                    temp[j] = -np.Infinity
-            action = np.argmax(temp)
+            state0 = T.as_tensor(state, dtype=T.float)  # else, pick off of policy
+            with T.no_grad():
+                prediction = self.model(state0)
+            mask0 = T.as_tensor(mask, device=prediction.device)
+            action = T.argmax(prediction.masked_fill(~mask0, -T.inf))
 
         return int(action)
 
 
-def train():
-    # keeping track of training
-    plot_win_rate = []
-    plot_avg_reward = []
+def init_ui(offscreen, win_width, win_height, square_size):
+    """
+    Set up what rendered games are drawn on
+    Args:
+        offscreen - T/F if drawing to an offscreen surface instead of a window
+        win_width - width of the drawing surface in pixels
+        win_height - height of the drawing surface in pixels
+        square_size - the size of an individual square in pixels
+    Returns:
+        A tuple of the surface to draw on and the images to draw with
+    """
+    # rendering is optional, headless runs never import pygame
+    import pygame
+    from sprites import load_images
+
+    pygame.init()
+    if offscreen:
+        window = pygame.Surface((win_width, win_height))
+    else:
+        window = pygame.display.set_mode((win_width, win_height))
+        pygame.display.set_caption("Minesweeper")
+    return window, load_images(square_size)
+
+
+def train(
+    render_every=0,
+    offscreen=False,
+    render_dir="renders",
+    reward_mode="heuristic",
+    metrics_path="metrics/train.csv",
+    view=False,
+    profile=False,
+    profile_every=100,
+    trace=None,
+    trace_path="profile",
+    update_every=4,
+    gradient_steps=1,
+    replay_ratio=None,
+):
+    """
+    Train the agent, headless unless asked to render
+    Args:
+        render_every - draw every K-th game, 0 never draws (and never
+        touches the display)
+        offscreen - draw to an offscreen surface instead of a window,
+        saving the final board of each drawn game to render_dir
+        render_dir - folder the offscreen renders are saved in
+        reward_mode - how safe clears are rewarded, see Minesweeper
+        metrics_path - file every episode's metrics are written to, see
+        metrics.py
+        view - T/F if a viewer process plots the metrics while training
+        profile - T/F if every phase of the loop is timed, see profiler.py
+        profile_every - print the phase timings every K games
+        trace - None, 'cprofile' for a whole-program trace written when
+        training stops, or 'torch' for a trace of the first 20 games
+        trace_path - file the trace is written to
+        update_every - train every M moves on mini-batches from replay
+        memory, 0 trains on each move as it happens (train_short_memory)
+        gradient_steps - the number of mini-batches K trained on every
+        update_every moves
+        replay_ratio - if given, overrides gradient_steps so each move is
+        trained on replay_ratio times on average, i.e. K is
+        replay_ratio * update_every / batch_size, carrying fractions over
+    Returns:
+        Nothing
+    """
+    # keeping track of training, written out by a background thread
+    metrics = MetricsLogger(metrics_path)
+    if view:
+        launch_viewer(metrics_path)
     wins = 0
     reward_tot = 0
+    episode_reward = 0
+    episode_length = 0
+    episode_start = time.perf_counter()
     n = 5
     mine_cnt = 2
     record = 0
+    # phase timers cost one call each when profiling is off
+    timer = PhaseTimer(
+        enabled=profile,
+        sync=T.cuda.synchronize if T.cuda.is_available() else None,
+        label=trace == "torch",
+    )
+    tracer = Trace(trace, trace_path)
+
     # initialize agent and game
     agent = Agent(
         eps_start=1,
@@ -151,90 +303,166 @@ def train():
         batch_size=128,
         lr=0.01,
         n=5,
+        timer=timer,
     )
-    game = Minesweeper(n=5, mine_cnt=mine_cnt)
+    game = Minesweeper(n=5, mine_cnt=mine_cnt, reward_mode=reward_mode)
 
-    game.board = [
-        [-1, -1, -1, -1, -1],
-        [-1, -1, -1, -1, -1],
-        [-1, -1, -1, -1, -1],
-        [-1, -1, -1, -1, -1],
-        [-1, -1, -3, -1, -3],
-    ]
+    game.set_board(
+        [
+            [-1, -1, -1, -1, -1],
+            [-1, -1, -1, -1, -1],
+            [-1, -1, -1, -1, -1],
+            [-1, -1, -1, -1, -1],
+            [-1, -1, -3, -1, -3],
+        ]
+    )
 
     game.first_click = False
 
-    # initialize UI
-    pygame.init()
+    # initialize UI, only if games are drawn
     win_width, win_height = 600, 600
     play_width, play_height = 600, 600
     square_size = 120
-    window = pygame.display.set_mode((win_width, win_height))
-    pygame.display.set_caption("Minesweeper")
-
     board_width, board_height = int(play_width / square_size), int(
         play_height / square_size
     )
-    images = load_images()
-    game.draw_board(board_width, board_height, images, window, square_size)
-    pygame.display.update()
-
-    while True:
-        # get current state
-        state_curr = agent.get_state(game)
-
-        # get action
-        final_action = agent.get_action(state_curr, game)
-
-        # convert action into (x, y)
-        x = final_action // n
-        y = final_action % n
-
-        # perform action and get new state
-        reward, done, score = game.play((x, y))
-        state_new = agent.get_state(game)
-        reward_tot += reward
-
-        # draw the board to reflect the action taken
-        game.draw_board(board_width, board_height, images, window, square_size)
-        pygame.display.update()
-
-        # train short memory of agent
-        agent.train_short_memory(state_curr, final_action, reward, state_new, done)
-
-        # remember what happened
-        agent.remember(state_curr, final_action, reward, state_new, done)
-
-        if done:
-            # train the long memory of agent, plot results
-            game.restart_game()
-            game.board = [
-                [-1, -1, -1, -1, -1],
-                [-1, -1, -1, -1, -1],
-                [-1, -1, -1, -1, -1],
-                [-1, -1, -1, -1, -1],
-                [-1, -1, -3, -1, -3],
-            ]
-            game.first_click = False
-            agent.n_games += 1
-            agent.train_long_memory()
-
-            # book keeping
-            if score > record:
-                record = score
-                agent.model.save()
-
-            if score == n**2 - mine_cnt:  # win
-                wins += 1
-
-            # plotting
-            if agent.n_games % 100 == 0:
-                plot_win_rate.append(wins / 100)
-                print(f"Average reward over this set: {reward_tot / 100}")
-                print(f"Epsilon value: {agent.epsilon}")
-                wins = 0
-                reward_tot = 0
-                plot(plot_win_rate)
+    if render_every:
+        import pygame
+
+        window, images = init_ui(offscreen, win_width, win_height, square_size)
+        if offscreen:
+            os.makedirs(render_dir, exist_ok=True)
+
+    def draw():
+        with timer.phase("draw_board"):
+            rects = game.draw_board(
+                board_width, board_height, images, window, square_size
+            )
+        if not offscreen:
+            pygame.event.pump()  # keep the window responsive
+            pygame.display.update(rects)
+
+    rendering = render_every and agent.n_games % render_every == 0
+    if rendering:
+        draw()
+
+    # mini-batches owed to the update schedule
+    if replay_ratio is not None:
+        gradient_steps = replay_ratio * update_every / agent.batch_size
+    owed = 0.0
+    moves = 0
+
+    tracer.start()
+    try:
+        while True:
+            # get current state
+            with timer.phase("get_state"):
+                state_curr = agent.get_state(game)
+
+            # get action
+            with timer.phase("get_action"):
+                final_action = agent.get_action(state_curr, game)
+
+            # convert action into (x, y)
+            x = final_action // n
+            y = final_action % n
+
+            # perform action and get new state
+            with timer.phase("play"):
+                reward, done, score = game.play((x, y))
+            with timer.phase("get_state"):
+                state_new = agent.get_state(game)
+            reward_tot += reward
+            episode_reward += reward
+            episode_length += 1
+
+            # draw the board to reflect the action taken
+            if rendering:
+                draw()
+
+            # remember what happened
+            with timer.phase("remember"):
+                agent.remember(state_curr, final_action, reward, state_new, done)
+
+            # train K mini-batches every M moves, or on every move
+            moves += 1
+            if not update_every:
+                with timer.phase("train_short_memory"):
+                    agent.train_short_memory(
+                        state_curr, final_action, reward, state_new, done
+                    )
+            elif moves % update_every == 0:
+                owed += gradient_steps
+                with timer.phase("train_batch"):
+                    for _ in range(int(owed)):
+                        agent.train_batch()
+                owed -= int(owed)
+
+            if done:
+                if rendering and offscreen:
+                    pygame.image.save(
+                        window, os.path.join(render_dir, f"game_{agent.n_games}.png")
+                    )
+
+                # train the long memory of agent, plot results
+                game.restart_game()
+                game.set_board(
+                    [
+                        [-1, -1, -1, -1, -1],
+                        [-1, -1, -1, -1, -1],
+                        [-1, -1, -1, -1, -1],
+                        [-1, -1, -1, -1, -1],
+                        [-1, -1, -3, -1, -3],
+                    ]
+                )
+                game.first_click = False
+                agent.n_games += 1
+                with timer.phase("train_long_memory"):
+                    td_errors = agent.train_long_memory()
+                rendering = render_every and agent.n_games % render_every == 0
+                if rendering:
+                    draw()
+
+                # book keeping
+                if score > record:
+                    record = score
+                    agent.model.save()
+
+                won = score == n**2 - mine_cnt
+                if won:
+                    wins += 1
+
+                # only copies a row, the file is written in the background
+                elapsed = time.perf_counter() - episode_start
+                metrics.record(
+                    episode=agent.n_games,
+                    reward=episode_reward,
+                    score=score,
+                    length=episode_length,
+                    won=won,
+                    epsilon=agent.epsilon,
+                    loss=(td_errors**2).mean().item(),
+                    td_error=td_errors.abs().mean().item(),
+                    steps_per_sec=episode_length / elapsed if elapsed > 0 else 0,
+                )
+                episode_reward = 0
+                episode_length = 0
+                episode_start = time.perf_counter()
+
+                if agent.n_games % 100 == 0:
+                    print(f"Win rate over this set: {wins / 100}")
+                    print(f"Average reward over this set: {reward_tot / 100}")
+                    print(f"Epsilon value: {agent.epsilon}")
+                    wins = 0
+                    reward_tot = 0
+
+                tracer.step()
+                if profile and agent.n_games % profile_every == 0:
+                    print(timer.report())
+    finally:
+        metrics.close()
+        if tracer.stop():
+            print(f"Trace written to {trace_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,382 @@
+import argparse
+import json
+import math
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from game import Minesweeper
+from profiler import NUM_BUCKETS, latency_histogram, percentile
+
+# (n, m, mine_cnt) of the standard difficulties
+PRESETS = {
+    "beginner": (9, 9, 10),
+    "intermediate": (16, 16, 40),
+    "expert": (30, 16, 99),
+}
+
+POLICIES = ["random", "solver", "probability", "dqn"]
+
+
+def wilson_interval(wins, games, z=1.96):
+    """
+    Wilson score interval of a win rate
+    Args:
+        wins - the number of games won
+        games - the number of games played
+        z - the normal quantile, 1.96 for 95%
+    Returns:
+        A tuple (low, high)
+    """
+    if games == 0:
+        return 0.0, 1.0
+    p = wins / games
+    denom = 1 + z**2 / games
+    center = (p + z**2 / (2 * games)) / denom
+    spread = z * math.sqrt(p * (1 - p) / games + z**2 / (4 * games**2)) / denom
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+class RandomPolicy:
+    """
+    Clicks a uniformly random unrevealed square
+    """
+
+    def __init__(self, n, m, mine_cnt, rng):
+        self.rng = rng
+
+    def act(self, game):
+        """
+        Pick the next square to click
+        Args:
+            game - the game instance
+        Returns:
+            The (x, y) square
+        """
+        action = self.rng.choice(np.flatnonzero(game.action_mask()))
+        return divmod(int(action), game.m)
+
+
+class SolverPolicy:
+    """
+    Clicks a provably safe square when there is one, otherwise guesses a
+    random square the solver can't rule out
+    """
+
+    def __init__(self, n, m, mine_cnt, rng):
+        from solver import Solver
+
+        self.solver = Solver(n, mine_cnt, m=m)
+        self.rng = rng
+
+    def act(self, game):
+        """
+        Pick the next square to click
+        Args:
+            game - the game instance
+        Returns:
+            The (x, y) square
+        """
+        safe, mines = self.solver.update(game.board)
+        if safe:
+            return min(safe)
+        candidates = game.action_mask().reshape(game.shape)
+        for cell in mines:
+            candidates[cell] = False
+        action = self.rng.choice(np.flatnonzero(candidates))
+        return divmod(int(action), game.m)
+
+
+class ProbabilityPolicy:
+    """
+    Clicks the square least likely to be a mine, see probability.py
+    """
+
+    def __init__(self, n, m, mine_cnt, rng):
+        from probability import MineProbability
+
+        self.probability = MineProbability(n, mine_cnt, m=m)
+        self.rng = rng
+
+    def act(self, game):
+        """
+        Pick the next square to click
+        Args:
+            game - the game instance
+        Returns:
+            The (x, y) square
+        """
+        if game.first_click:
+            return divmod(int(self.rng.integers(game.n * game.m)), game.m)
+        probs = self.probability.update(game.board)
+        probs[game.revealed] = np.inf
+        best = np.flatnonzero(probs == probs.min())
+        return divmod(int(self.rng.choice(best)), game.m)
+
+
+class DQNPolicy:
+    """
+    Clicks greedily by a trained Linear_QNet, with the same state layout
+    and action mask as Agent.get_state and Agent.get_action
+    """
+
+    models = {}  # model file -> network, loaded once per worker
+
+    def __init__(self, n, m, mine_cnt, rng, model_path):
+        import torch as T
+        from dqn import Linear_QNet
+
+        if n != m:
+            raise ValueError("The dqn policy only plays square boards")
+        if model_path not in self.models:
+            # one thread per worker, the pool provides the parallelism
+            T.set_num_threads(1)
+            model = Linear_QNet(n**2, 128, 128, n**2)
+            state = T.load(model_path, map_location=model.device)
+            model.load_state_dict(state)
+            model.eval()
+            self.models[model_path] = model
+        self.model = self.models[model_path]
+        self.T = T
+
+    def act(self, game):
+        """
+        Pick the next square to click
+        Args:
+            game - the game instance
+        Returns:
+            The (x, y) square
+        """
+        T = self.T
+        state = np.where(game.board == -3, -1, game.board).flatten("F")
+        with T.no_grad():
+            prediction = self.model(T.as_tensor(state, dtype=T.float))
+        mask = T.as_tensor(game.action_mask(), device=prediction.device)
+        action = int(T.argmax(prediction.masked_fill(~mask, -T.inf)))
+        return divmod(action, game.n)
+
+
+def make_policy(name, n, m, mine_cnt, rng, model_path=None):
+    """
+    Create a policy by name
+    Args:
+        name - one of POLICIES
+        n, m - the board dimensions
+        mine_cnt - the number of mines
+        rng - numpy.random.Generator for the policy's own choices
+        model_path - weights file for the 'dqn' policy
+    Returns:
+        An object with an act(game) method returning an (x, y) square
+    """
+    if name == "random":
+        return RandomPolicy(n, m, mine_cnt, rng)
+    if name == "solver":
+        return SolverPolicy(n, m, mine_cnt, rng)
+    if name == "probability":
+        return ProbabilityPolicy(n, m, mine_cnt, rng)
+    if name == "dqn":
+        return DQNPolicy(n, m, mine_cnt, rng, model_path)
+    raise ValueError(f"Unknown policy: {name}")
+
+
+def warm_worker(policy, n, m, mine_cnt, model_path=None):
+    """
+    Start a worker and load what the policy needs, so process startup and
+    imports aren't timed as gameplay
+    Args:
+        policy - the policy name
+        n, m, mine_cnt - the board configuration
+        model_path - weights file for the 'dqn' policy
+    Returns:
+        The worker's process id
+    """
+    make_policy(policy, n, m, mine_cnt, np.random.default_rng(), model_path)
+    return os.getpid()
+
+
+def play_games(n, m, mine_cnt, policy, seed, start, stop, model_path=None):
+    """
+    Play a range of seeded games, game i being seeded with (seed, i) so
+    results don't depend on how games are split between workers
+    Args:
+        n, m, mine_cnt - the board configuration
+        policy - the policy name
+        seed - the base seed
+        start - index of the first game
+        stop - index after the last game
+        model_path - weights file for the 'dqn' policy
+    Returns:
+        A dictionary of the games, wins, moves, latency histogram and the
+        seconds spent playing
+    """
+    begin_task = time.perf_counter()
+    wins = 0
+    moves = 0
+    histogram = np.zeros(NUM_BUCKETS, dtype=np.int64)
+    latencies = np.empty(n * m, dtype=np.int64)  # a game never takes more moves
+    for i in range(start, stop):
+        rng = np.random.default_rng([seed, i])
+        game = Minesweeper(n, mine_cnt, rng=rng, m=m)
+        agent = make_policy(policy, n, m, mine_cnt, rng, model_path)
+        game_over = False
+        t = 0
+        while not game_over:
+            begin = time.perf_counter_ns()
+            _, game_over, _ = game.play(agent.act(game))
+            latencies[t] = time.perf_counter_ns() - begin
+            t += 1
+        wins += game.won
+        moves += t
+        histogram += latency_histogram(latencies[:t])
+    return {
+        "games": stop - start,
+        "wins": wins,
+        "moves": moves,
+        "histogram": histogram,
+        "busy": time.perf_counter() - begin_task,
+    }
+
+
+def run_benchmark(
+    preset,
+    games,
+    policy="solver",
+    workers=None,
+    seed=0,
+    chunk=None,
+    model_path=None,
+):
+    """
+    Play seeded games across a process pool and summarize them
+    Args:
+        preset - a PRESETS name, or an (n, m, mine_cnt) tuple
+        games - the number of games to play
+        policy - the policy name, see POLICIES
+        workers - the number of worker processes, defaults to the CPU count
+        seed - the base seed, the same seed replays the same games
+        chunk - the number of games per task, picked from games and workers
+        if None
+        model_path - weights file for the 'dqn' policy
+    Returns:
+        A dictionary of results, see main
+    """
+    n, m, mine_cnt = PRESETS[preset] if isinstance(preset, str) else preset
+    workers = workers or os.cpu_count() or 1
+    if chunk is None:
+        chunk = max(1, min(1000, games // (workers * 8)))
+
+    wins = moves = 0
+    busy = 0.0
+    histogram = np.zeros(NUM_BUCKETS, dtype=np.int64)
+    with ProcessPoolExecutor(workers) as pool:
+        # start every worker before the clock does
+        warm = [
+            pool.submit(warm_worker, policy, n, m, mine_cnt, model_path)
+            for _ in range(workers)
+        ]
+        for task in warm:
+            task.result()
+
+        start = time.perf_counter()
+        tasks = [
+            pool.submit(
+                play_games,
+                n,
+                m,
+                mine_cnt,
+                policy,
+                seed,
+                i,
+                min(i + chunk, games),
+                model_path,
+            )
+            for i in range(0, games, chunk)
+        ]
+        for task in as_completed(tasks):
+            result = task.result()
+            wins += result["wins"]
+            moves += result["moves"]
+            histogram += result["histogram"]
+            busy += result["busy"]
+        elapsed = time.perf_counter() - start
+
+    low, high = wilson_interval(wins, games)
+    return {
+        "preset": preset if isinstance(preset, str) else f"{n}x{m}/{mine_cnt}",
+        "n": n,
+        "m": m,
+        "mines": mine_cnt,
+        "policy": policy,
+        "games": games,
+        "wins": wins,
+        "win_rate": wins / games if games else 0.0,
+        "win_rate_ci95": [low, high],
+        "moves": moves,
+        "seconds": elapsed,
+        "busy_seconds": busy,
+        "games_per_sec": games / elapsed,
+        "moves_per_sec": moves / elapsed,
+        "latency_p50_us": percentile(histogram, 50) / 1000,
+        "latency_p99_us": percentile(histogram, 99) / 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minesweeper win-rate benchmark")
+    parser.add_argument(
+        "--preset",
+        nargs="+",
+        default=["beginner"],
+        help=f"board presets ({', '.join(PRESETS)}) or custom NxM/MINES",
+    )
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=POLICIES, default="solver")
+    parser.add_argument("--model", default="model/model.pth", help="for dqn")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=None)
+    parser.add_argument("--out", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for preset in args.preset:
+        if preset not in PRESETS:  # e.g. 20x20/60
+            size, mine_cnt = preset.split("/")
+            n, m = size.split("x")
+            preset = (int(n), int(m), int(mine_cnt))
+        result = run_benchmark(
+            preset,
+            args.games,
+            policy=args.policy,
+            workers=args.workers,
+            seed=args.seed,
+            chunk=args.chunk,
+            model_path=args.model,
+        )
+        results.append(result)
+        low, high = result["win_rate_ci95"]
+        print(
+            f"{result['preset']:>12} {result['policy']}: "
+            f"win rate {result['win_rate']:.4f} [{low:.4f}, {high:.4f}], "
+            f"{result['games_per_sec']:.1f} games/s, "
+            f"{result['moves_per_sec']:.1f} moves/s, "
+            f"p50 {result['latency_p50_us']:.1f} us, "
+            f"p99 {result['latency_p99_us']:.1f} us"
+        )
+
+    if args.out:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
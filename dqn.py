@@ -3,10 +3,33 @@ import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 import os
+from profiler import DISABLED
 
 
-class Linear_QNet(nn.Module):
-    def __init__(self, input_size, first_size, second_size, output_size):
+class QNet(nn.Module):
+    """
+    Base class for the Q-networks, handles saving their weights
+    """
+
+    def save(self, file_name="model.pth"):
+        """
+        Save the weights of the Neural Network
+        Args:
+            file_name - the name of the file to save the weights to
+            default is 'model.pth'
+        Returns:
+            Nothing
+        """
+        model_folder_path = "./model"
+        if not os.path.exists(model_folder_path):
+            os.makedirs(model_folder_path)
+
+        file_name = os.path.join(model_folder_path, file_name)
+        T.save(self.state_dict(), file_name)
+
+
+class Linear_QNet(QNet):
+    def __init__(self, input_size, first_size, second_size, output_size, dueling=False):
         """
         A simple neural network with 3 layers
         Args:
@@ -14,12 +37,16 @@ class Linear_QNet(nn.Module):
             first_size - number of neurons in the first hidden layer
             second_size - number of neurons in the second hidden layer
             output_size - number of neurons in the ouput layer
+            dueling - T/F if the last layer is split into a state value and
+            per-action advantages, Q = V + A - mean(A). The advantage layer
+            keeps the name linear3, so only the value layer is new
 
         """
         super().__init__()
         self.linear1 = nn.Linear(input_size, first_size)
         self.linear2 = nn.Linear(first_size, second_size)
         self.linear3 = nn.Linear(second_size, output_size)
+        self.value = nn.Linear(second_size, 1) if dueling else None
 
         self.device = T.device("cuda:0" if T.cuda.is_available() else "cpu")
         self.to(self.device)
@@ -35,35 +62,93 @@ class Linear_QNet(nn.Module):
         x = x.to(self.device)
         x = F.relu(self.linear1(x))
         x = F.relu(self.linear2(x))
-        return self.linear3(x)
+        if self.value is None:
+            return self.linear3(x)
+        advantage = self.linear3(x)
+        return self.value(x) + advantage - advantage.mean(dim=-1, keepdim=True)
 
-    def save(self, file_name="model.pth"):
+
+class Conv_QNet(QNet):
+    def __init__(self, in_channels, hidden_channels, num_layers, dueling=False):
         """
-        Save the weights of the Neural Network
+        A fully convolutional neural network mapping a (C, n, n) board to
+        an (n, n) map of Q values, flattened to n**2 actions
+        Its weights don't depend on n, so one model works for any board size
         Args:
-            file_name - the name of the file to save the weights to
-            default is 'model.pth'
-        Returns:
-            Nothing
+            in_channels - number of channels C in the input board
+            hidden_channels - number of channels in each hidden layer
+            num_layers - number of 3x3 convolutional layers
+            dueling - T/F if the Q map is split into per-square advantages
+            and a state value from the average of the last hidden layer,
+            Q = V + A - mean(A)
         """
-        model_folder_path = "./model"
-        if not os.path.exists(model_folder_path):
-            os.makedirs(model_folder_path)
+        super().__init__()
+        self.convs = nn.ModuleList(
+            [
+                nn.Conv2d(
+                    in_channels if i == 0 else hidden_channels,
+                    hidden_channels,
+                    kernel_size=3,
+                    padding=1,
+                )
+                for i in range(num_layers)
+            ]
+        )
+        self.head = nn.Conv2d(hidden_channels, 1, kernel_size=1)  # Q per square
+        self.value = nn.Linear(hidden_channels, 1) if dueling else None
 
-        file_name = os.path.join(model_folder_path, file_name)
-        T.save(self.state_dict(), file_name)
+        self.device = T.device("cuda:0" if T.cuda.is_available() else "cpu")
+        self.to(self.device)
+
+    def forward(self, x):
+        """
+        Forward propagation of an instance x
+        Args:
+            x - the input, (C, n, n) or a batch (B, C, n, n)
+        Returns
+            the output y, (n**2,) or (B, n**2), indexed by x * n + y
+        """
+        x = x.to(self.device)
+        unbatched = x.dim() == 3
+        if unbatched:
+            x = x.unsqueeze(0)
+        for conv in self.convs:
+            x = F.relu(conv(x))
+        q = self.head(x).flatten(1)
+        if self.value is not None:
+            q = self.value(x.mean(dim=(2, 3))) + q - q.mean(dim=-1, keepdim=True)
+        return q.squeeze(0) if unbatched else q
 
 
 class QTrainer:
-    def __init__(self, model, target_model, lr, gamma, update_freq):
+    def __init__(
+        self,
+        model,
+        target_model,
+        lr,
+        gamma,
+        update_freq,
+        timer=DISABLED,
+        double=False,
+        tau=None,
+    ):
         """
         Training class using Q learning
         Args:
             model - the model used to train
-            target_model - the target model to compare Q values
+            target_model - the target model to compare Q values, starts as a
+            copy of model
             lr - the learning rate
             gamma - discount factor
-            update_freq - how often the target network is updated (in iterations)
+            update_freq - how often the target network is updated (in
+            iterations), ignored when tau is given
+            timer - PhaseTimer timing the forward, backward and optimizer
+            stages of each step, see profiler.py
+            double - T/F if targets use Double DQN: the model picks the next
+            action and the target network values it
+            tau - if given, the target network moves tau of the way towards
+            the model after every step (Polyak averaging) instead of being
+            copied every update_freq steps
         """
         self.model = model
         self.target_model = target_model
@@ -73,6 +158,14 @@ class QTrainer:
         self.loss = nn.MSELoss()
         self.update_freq = update_freq
         self.update_cntr = 0
+        self.timer = timer
+        self.double = double
+        self.tau = tau
+
+        # parameter lists for the fused soft update, in matching order
+        self.params = list(model.parameters())
+        self.target_params = list(target_model.parameters())
+        self.update_target_network()
 
     def update_target_network(self):
         """
@@ -84,7 +177,19 @@ class QTrainer:
         """
         self.target_model.load_state_dict(self.model.state_dict())
 
-    def train_step(self, state, action, reward, next_state, done):
+    def soft_update_target_network(self):
+        """
+        Move every target network weight tau of the way towards the model's,
+        in place and in one fused call over all parameters
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        with T.no_grad():
+            T._foreach_lerp_(self.target_params, self.params, self.tau)
+
+    def train_step(self, state, action, reward, next_state, done, weights=None):
         """
         Train the model
         Args:
@@ -93,43 +198,61 @@ class QTrainer:
             reward - the reward recieved at 'state'
             next_state - the state reached by taking 'action' at 'state'
             done - T/F if transitioned to terminal state
+            weights - optional per-sample importance sampling weights
         Returns:
-            Nothing
+            The TD error of every sample, as a detached tensor
         """
-        state = T.tensor(state, dtype=T.float).to(self.model.device)
-        action = T.tensor(action, dtype=T.float).to(self.model.device)
-        reward = T.tensor(reward, dtype=T.float).to(self.model.device)
-        next_state = T.tensor(next_state, dtype=T.float).to(self.model.device)
+        # batches sampled from replay memory already arrive as tensors
+        device = self.model.device
+        state = T.as_tensor(state, dtype=T.float, device=device)
+        action = T.as_tensor(action, dtype=T.long, device=device)  # indices
+        reward = T.as_tensor(reward, dtype=T.float, device=device)
+        next_state = T.as_tensor(next_state, dtype=T.float, device=device)
+        done = T.as_tensor(done, dtype=T.bool, device=device)
 
-        if len(state.shape) == 1:
-            # reshaping
+        if len(action.shape) == 0:
+            # reshaping a single step into a batch of one
             state = T.unsqueeze(state, 0)
             action = T.unsqueeze(action, 0)
             reward = T.unsqueeze(reward, 0)
             next_state = T.unsqueeze(next_state, 0)
-            done = (done,)
+            done = T.unsqueeze(done, 0)
 
         # get the predicted Q values with current state
-        pred = self.model(state)
-        pred_next = self.target_model(next_state)
+        with self.timer.phase("forward"):
+            pred = self.model(state)
+            with T.no_grad():
+                pred_next = self.target_model(next_state)  # added target network
+                if self.double:
+                    # the model picks the next action, the target values it
+                    next_action = self.model(next_state).argmax(dim=1, keepdim=True)
+                    Q_next = pred_next.gather(1, next_action).squeeze(1)
+                else:
+                    Q_next = pred_next.max(dim=1).values
 
-        target = pred.clone()
-        for i in range(len(done)):
-            Q_new = reward[i]
-            if not done[i]:
-                # apply R + y(max Q(next_state))
-                Q_new = reward[i] + self.gamma * T.max(
-                    pred_next[i]
-                )  # modifications here, added target network
+                # apply R + y(Q(next_state)), only R for terminal states
+                Q_new = reward + self.gamma * Q_next * ~done
 
-            target[i][T.argmax(action[i]).item()] = Q_new
+                # target only differs from pred at the action taken
+                action = action.unsqueeze(1)
+                target = pred.detach().scatter(1, action, Q_new.unsqueeze(1))
+                td_errors = Q_new - pred.detach().gather(1, action).squeeze(1)
 
-        self.optimizer.zero_grad()
-        loss = self.loss(target, pred)
-        loss.backward()
-        self.optimizer.step()
+        with self.timer.phase("backward"):
+            self.optimizer.zero_grad()
+            if weights is None:
+                loss = self.loss(target, pred)
+            else:
+                loss = (weights.unsqueeze(1) * (target - pred) ** 2).mean()
+            loss.backward()
+        with self.timer.phase("optimizer"):
+            self.optimizer.step()
 
         # update the target network when prerequisite is met
         self.update_cntr += 1
-        if self.update_cntr % self.update_freq == 0:
+        if self.tau is not None:
+            self.soft_update_target_network()
+        elif self.update_cntr % self.update_freq == 0:
             self.update_target_network()
+
+        return td_errors
@@ -0,0 +1,27 @@
+import numpy as np
+
+# channels of the one-hot encoding: unrevealed, flagged, then revealed 0-8
+NUM_CHANNELS = 11
+
+# maps a square's value to its channel: 0..8 index from the front and
+# -5..-1 wrap around from the back, so boards index it without an offset
+# copy. Mines are encoded like any other unrevealed or flagged square so
+# they stay hidden
+CHANNEL_OF = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 0, 1, 0, 1, 0], dtype=np.int8)
+CHANNELS = np.arange(NUM_CHANNELS, dtype=np.int8)[:, np.newaxis, np.newaxis]
+
+
+def encode_states(boards, out=None):
+    """
+    One-hot encode boards into channels-first boolean planes
+    Args:
+        boards - a single (n, n) board or a batch (B, n, n), using the
+        Minesweeper board representation
+        out - optional preallocated boolean array of shape (C, n, n) or
+        (B, C, n, n) to write into, so only the (n, n) or (B, n, n) map of
+        channels is allocated
+    Returns:
+        The encoded boards, shaped (C, n, n) or (B, C, n, n)
+    """
+    channel = CHANNEL_OF[np.asarray(boards)]
+    return np.equal(channel[..., np.newaxis, :, :], CHANNELS, out=out)
@@ -1,9 +1,8 @@
-import pygame
 import numpy as np
-import random
-import sys
-import time
-from sprites import load_images
+
+# offsets to the 8 neighbors of a square
+NEIGHBOR_DX = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+NEIGHBOR_DY = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
 
 
 class Minesweeper:
@@ -16,17 +15,119 @@ class Minesweeper:
     -3 if a square is a mine and unclicked or unflagged
     -4 if a square is a mine and flagged
     -5 if a square is a mine and clicked
+    The board is stored as an int8 NumPy array, alongside boolean masks
+    for mines, revealed squares and flags so that the game logic can be
+    vectorized
+    Progress is tracked incrementally, so checking for a win or a loss
+    never needs a scan of the board:
+    revealed_cnt - the number of safe squares revealed so far
+    safe_cnt - the number of safe squares needed to win
+    lost - True once a mine has been clicked
+    won - True once every safe square has been revealed
+    Squares that change are marked in the dirty mask, so draw_board only
+    has to redraw those
     Args:
-        n - the size of the board (n x n)
+        n - the size of the board (n x n), or its first dimension if m is given
         mine_cnt - the number of mines
+        rng - optional numpy.random.Generator used to place mines,
+        pass a seeded one for reproducible boards
+        reward_mode - 'heuristic' rewards clicks next to revealed squares,
+        'solver' rewards clicks by what could be deduced, see solver_reward
+        m - optional second dimension for n x m boards, defaults to n
     """
 
-    def __init__(self, n, mine_cnt):
-        self.board = [[-1 for i in range(n)] for j in range(n)]
+    def __init__(self, n, mine_cnt, rng=None, reward_mode="heuristic", m=None):
         self.n = n
+        self.m = m if m is not None else n
+        self.shape = (self.n, self.m)
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.mines = mine_cnt
+        self.safe_cnt = self.n * self.m - mine_cnt
         self.flag_cnt = 0
         self.first_click = True
+        self.reward_mode = reward_mode
+        if reward_mode == "solver":
+            from solver import Solver  # solver.py imports this module
+
+            self.solver = Solver(n, mine_cnt, m=self.m)
+        elif reward_mode != "heuristic":
+            raise ValueError(f"Unknown reward mode: {reward_mode}")
+        self.clear_board()
+
+    def clear_board(self):
+        """
+        Reset the board and its masks to a fully unrevealed, mine-free
+        state, and the solver if there is one
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        self.board = np.full(self.shape, -1, dtype=np.int8)
+        self.mine = np.zeros(self.shape, dtype=bool)
+        self.revealed = np.zeros(self.shape, dtype=bool)
+        self.flagged = np.zeros(self.shape, dtype=bool)
+        self.dirty = np.ones(self.shape, dtype=bool)  # redraw everything
+        self.adjacent = np.zeros(self.shape, dtype=np.int8)
+        self.revealed_cnt = 0
+        self.lost = False
+        self.won = False
+        if self.reward_mode == "solver":
+            self.solver.reset()  # its deductions were about the old board
+
+    def set_board(self, board):
+        """
+        Load a board given in the -1..-5 / 0..8 representation,
+        rebuilding the masks (and resetting the solver) to match
+        Args:
+            board - an n x n array-like using the board representation
+        Returns:
+            Nothing
+        """
+        self.board = np.array(board, dtype=np.int8)
+        self.mine = np.isin(self.board, (-3, -4, -5))
+        self.revealed = self.board >= 0
+        self.flagged = np.isin(self.board, (-2, -4))
+        self.dirty = np.ones(self.shape, dtype=bool)  # redraw everything
+        self.flag_cnt = int(self.flagged.sum())
+        self.revealed_cnt = int(self.revealed.sum())
+        self.lost = bool((self.board == -5).any())
+        self.won = self.revealed_cnt == self.safe_cnt
+        self.count_adjacent()
+        if self.reward_mode == "solver":
+            self.solver.reset()  # it catches up with the board on its next update
+
+    def count_adjacent(self):
+        """
+        Precompute the number of neighboring mines for every square
+        by summing shifted copies of the mine mask
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        padded = np.pad(self.mine, 1).astype(np.int8)
+        adjacent = -padded[1:-1, 1:-1]  # squares don't neighbor themselves
+        for dx in range(3):
+            for dy in range(3):
+                adjacent += padded[dx : dx + self.n, dy : dy + self.m]
+        self.adjacent = adjacent
+
+    def window(self, x, y, d=1):
+        """
+        Slices selecting the square at (x, y) and its neighbors at depth d,
+        clipped to the board
+        Args:
+            x - the x index
+            y - the y index
+            d - the depth of the neighborhood
+        Returns:
+            A tuple of slices that can index the board or any of its masks
+        """
+        return (
+            slice(max(0, x - d), min(x + d + 1, self.n)),
+            slice(max(0, y - d), min(y + d + 1, self.m)),
+        )
 
     def place_mines(self, first_click):
         """
@@ -36,49 +137,67 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        mines_to_place = []
         x, y = first_click
-        illegal_spots = self.get_neighbors(
-            x, y, 1, False
-        )  # ensuring that you can't insta-lose
-        illegal_spots.append((x, y))  # get_neighbors doesn't consider itself
-        # generating mines
-        while len(mines_to_place) < self.mines:
-            mine = (random.randrange(self.n), random.randrange(self.n))
-            if mine not in set(illegal_spots + mines_to_place):
-                mines_to_place.append(mine)
+        illegal = np.zeros(self.shape, dtype=bool)
+        illegal[self.window(x, y)] = True  # ensuring that you can't insta-lose
+        allowed = np.flatnonzero(~illegal)
+        if self.mines > allowed.size:
+            raise ValueError(
+                f"Cannot place {self.mines} mines on a {self.n}x{self.m} board"
+            )
+        # generating mines, sampling without replacement
+        mines_to_place = self.rng.choice(allowed, size=self.mines, replace=False)
+        self.mine.reshape(-1)[mines_to_place] = True
         # placing mines
-        for m in mines_to_place:
-            i, j = m
-            self.board[i][j] = -3
+        self.board[self.mine & ~self.flagged] = -3
+        self.board[self.mine & self.flagged] = -4
+        self.count_adjacent()
 
     def reveal(self, x, y):
         """
         Reveal adjacent squares according to minesweeper rules
+        The flood fill is done iteratively, one wavefront of flat indices
+        at a time, so it never recurses no matter how large the board is
         Args:
             x - the x index of the square clicked
             y - the y index of the square clicked
         Returns:
             Nothing
         """
-        # base case, we never auto-reveal non -1 squares
-        if self.board[x][y] != -1:
+        # we never auto-reveal non -1 squares
+        if self.board[x, y] != -1:
             return
 
-        # updating revealed square to show neighboring mines
-        mines = self.get_neighbors(x, y, 1, True)
-        self.board[x][y] = len(mines)
+        # flat views, so writes go straight through to the board and masks
+        board = self.board.reshape(-1)
+        revealed = self.revealed.reshape(-1)
+        adjacent = self.adjacent.reshape(-1)
+        dirty = self.dirty.reshape(-1)
 
-        # second base case, stop revealing when we've shown information
-        if len(mines) != 0:
-            return
+        frontier = np.array([x * self.m + y])
+        while frontier.size:
+            # updating revealed squares to show neighboring mines
+            board[frontier] = adjacent[frontier]
+            revealed[frontier] = True
+            dirty[frontier] = True
+            self.revealed_cnt += frontier.size
+
+            # stop revealing where we've shown information
+            zeros = frontier[adjacent[frontier] == 0]
+            if zeros.size == 0:
+                break
+
+            # a zero square has no neighboring mines to skip
+            rows, cols = np.divmod(zeros, self.m)
+            rows = rows[:, None] + NEIGHBOR_DX
+            cols = cols[:, None] + NEIGHBOR_DY
+            on_board = (rows >= 0) & (rows < self.n) & (cols >= 0) & (cols < self.m)
+            neighbors = np.unique(rows[on_board] * self.m + cols[on_board])
 
-        # only want to consider neighbors that aren't mines
-        for neighbor in set(self.get_neighbors(x, y, 1, False)) - set(mines):
-            i, j = neighbor
             # reveal rule: only reveal an adjacent tile if it's unrevealed
-            if self.board[i][j] == -1:
-                self.reveal(i, j)
+            frontier = neighbors[board[neighbors] == -1]
+
+        self.won = self.revealed_cnt == self.safe_cnt
 
     def get_neighbors(self, x, y, d, find_mine):
         """
@@ -91,16 +210,14 @@ class Minesweeper:
         Returns:
             A list of tuples, with each tuple representing a neighbor
         """
-        neighbors = []
-        for i in range(max(0, x - d), min(x + d + 1, self.n)):
-            for j in range(max(0, y - d), min(y + d + 1, self.n)):
-                if not (i == x and j == y):  # not considering itself a neighbor
-                    if not find_mine:
-                        neighbors.append((i, j))
-                    else:
-                        if self.board[i][j] in {-3, -4, -5}:
-                            neighbors.append((i, j))
-        return neighbors
+        area = self.window(x, y, d)
+        if find_mine:
+            selected = self.mine[area].copy()
+        else:
+            selected = np.ones(self.mine[area].shape, dtype=bool)
+        x0, y0 = area[0].start, area[1].start
+        selected[x - x0, y - y0] = False  # not considering itself a neighbor
+        return [(x0 + int(i), y0 + int(j)) for i, j in np.argwhere(selected)]
 
     def click(self, x, y):
         """
@@ -112,9 +229,9 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        if self.board[x][y] == -1:
+        if self.board[x, y] == -1:
             self.reveal(x, y)
-        elif self.board[x][y] == -3:  # game over
+        elif self.board[x, y] == -3:  # game over
             self.lose()
 
     def flag(self, x, y):
@@ -126,12 +243,11 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        sq = self.board[x][y]
-        if sq == -1:
-            self.board[x][y] = -2
-            self.flag_cnt += 1
-        elif sq == -3:
-            self.board[x][y] = -4
+        sq = self.board[x, y]
+        if sq in {-1, -3}:
+            self.board[x, y] = sq - 1  # -1 -> -2, -3 -> -4
+            self.flagged[x, y] = True
+            self.dirty[x, y] = True
             self.flag_cnt += 1
 
     def unflag(self, x, y):
@@ -143,30 +259,34 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        sq = self.board[x][y]
-        if sq == -2:
-            self.board[x][y] = -1
-            self.flag_cnt -= 1
-        if sq == -4:
-            self.board[x][y] = -3
+        sq = self.board[x, y]
+        if sq in {-2, -4}:
+            self.board[x, y] = sq + 1  # -2 -> -1, -4 -> -3
+            self.flagged[x, y] = False
+            self.dirty[x, y] = True
             self.flag_cnt -= 1
 
+    def action_mask(self):
+        """
+        Flags which squares are worth clicking, i.e. are still unrevealed
+        Args:
+            None
+        Returns:
+            A flat boolean array of n * m entries, indexed by x * m + y
+        """
+        return ~self.revealed.reshape(-1)
+
     def game_end(self):
         """
-        Iterate over the board to see if the game has ended
+        Check whether the game has ended
         Args:
             None
         Returns:
             Strings corresponding to a victory or a loss
         """
-        remaining = []
-        for x in range(self.n):
-            for y in range(self.n):
-                if self.board[x][y] == -5:  # lose condition
-                    return self.lose()
-                if self.board[x][y] in {-1, -2}:
-                    remaining.append(self.board[x][y])
-        if len(remaining) == 0:  # win condition
+        if self.lost:  # lose condition
+            return self.lose()
+        if self.won:  # win condition
             return self.win()
         # game isn't over, return accordingly
         return "continue"
@@ -191,10 +311,11 @@ class Minesweeper:
         Returns:
             The string: "You lost!"
         """
-        for x in range(self.n):
-            for y in range(self.n):
-                if self.board[x][y] == -3:
-                    self.board[x][y] = -5
+        if not self.lost:
+            exploded = self.board == -3
+            self.board[exploded] = -5
+            self.dirty |= exploded
+            self.lost = True
         return "You lost!"
 
     def restart_game(self):
@@ -206,7 +327,7 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        self.board = [[-1 for i in range(self.n)] for j in range(self.n)]
+        self.clear_board()
         self.first_click = True
         self.flag_cnt = 0
 
@@ -223,36 +344,31 @@ class Minesweeper:
         x, y = action
         reward = 0
         game_over = False
-        score = 0
 
         if self.first_click:  # first click has no reward
             self.place_mines((x, y))
             self.first_click = False
 
-        if self.board[x][y] == -1:  # safe square
-            if self.is_progress(x, y):  # reward meaningful moves
+        sq = self.board[x, y]
+        if sq == -1:  # safe square
+            if self.reward_mode == "solver":
+                reward += self.solver_reward(x, y)
+            elif self.is_progress(x, y):  # reward meaningful moves
                 reward += 0.3
             else:
                 reward -= 0.3  # punish 'guess' moves
             self.reveal(x, y)
-        elif self.board[x][y] == -3:  # game over, loss
+        elif sq == -3:  # game over, loss
             self.lose()
             game_over = True
             reward -= 2
-        elif self.board[x][y] in {0, 1, 2, 3, 4, 5, 6, 7, 8}:
+        elif sq >= 0:
             reward -= 0.1  # punish "nothing" moves
 
-        # calculate score (number of cleared squares)
-        for i in range(self.n):
-            for j in range(self.n):
-                if self.board[i][j] in {0, 1, 2, 3, 4, 5, 6, 7, 8}:
-                    score += 1
-                elif (
-                    self.board[i][j] == -3
-                ):  # properly account for losses (possible BUG)
-                    score -= 1000
-
-        if score == self.n**2 - self.mines:  # game over, win
+        # score is the number of cleared squares
+        score = self.revealed_cnt
+
+        if self.won:  # game over, win
             game_over = True
             reward = 1
 
@@ -268,39 +384,62 @@ class Minesweeper:
         Returns:
             T if progress, F if random guess
         """
-        progress = False
-        neighbors = self.get_neighbors(x, y, 1, False)
-        for neighbor in neighbors:
-            i, j = neighbor
-            if self.board[i][j] in {0, 1, 2, 3, 4, 5, 6, 7, 8}:
-                progress = True
-                break
-        return progress
+        # (x, y) itself is unrevealed, so it never counts towards progress
+        return bool(self.revealed[self.window(x, y)].any())
 
-    def draw_board(self, board_width, board_height, images, window, block_size):
+    def solver_reward(self, x, y):
+        """
+        Reward a safe clear at (x, y) by what could be deduced before it
+        The solver keeps its deductions between moves, so this only
+        processes the squares revealed since the last call
+        Args:
+            x - the x coordinate
+            y - the y coordinate
+        Returns:
+            0.3 if the square was provably safe, -0.3 if it was a guess
+            while a provably safe square existed, and -0.3 times the guess's
+            estimated risk if guessing was unavoidable
+        """
+        safe, _ = self.solver.update(self.board)
+        if (x, y) in safe:
+            return 0.3
+        if safe:
+            return -0.3
+        return -0.3 * self.solver.risk((x, y))
+
+    def draw_board(
+        self, board_width, board_height, images, window, block_size, full=False
+    ):
         """
         Function to draw out the board using Pygame
+        Only squares that changed since the last draw are redrawn
         Args:
             board_width - width of the board in terms of square count
             board_height - height of the board in terms of square count
             images - dictionary of images to use for the game squares
             window - the surface to draw on
             block_size - the size of an individual block in pixels
+            full - T/F if every square should be redrawn, e.g. on a new surface
         Returns:
-            None
+            A list of the rects that were drawn, to pass to pygame.display.update
         """
-        for x in range(board_width):
-            for y in range(board_height):
-                # this allows us to use the same indexing for the board
-                sq = self.board[x][y]
-                if sq in range(0, 9):
-                    window.blit(images["nums"][sq], (x * block_size, y * block_size))
-                elif sq == -1 or sq == -3:
-                    window.blit(images["block"], (x * block_size, y * block_size))
-                elif sq == -2 or sq == -4:
-                    window.blit(images["flagged"], (x * block_size, y * block_size))
-                elif sq == -5:
-                    window.blit(images["mine"], (x * block_size, y * block_size))
+        if full:
+            self.dirty[:] = True
+        rects = []
+        for x, y in np.argwhere(self.dirty[:board_width, :board_height]):
+            # this allows us to use the same indexing for the board
+            sq = self.board[x, y]
+            pos = (int(x) * block_size, int(y) * block_size)
+            if sq >= 0:
+                rects.append(window.blit(images["nums"][sq], pos))
+            elif sq == -1 or sq == -3:
+                rects.append(window.blit(images["block"], pos))
+            elif sq == -2 or sq == -4:
+                rects.append(window.blit(images["flagged"], pos))
+            elif sq == -5:
+                rects.append(window.blit(images["mine"], pos))
+        self.dirty[:board_width, :board_height] = False
+        return rects
 
     def print_board(self):
         """
@@ -311,4 +450,4 @@ class Minesweeper:
         Returns:
             Nothing
         """
-        print(np.matrix(self.board))
+        print(self.board)
@@ -0,0 +1,186 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import numpy as np
+
+# what is recorded for every episode
+FIELDS = [
+    "episode",
+    "reward",
+    "score",
+    "length",
+    "won",
+    "epsilon",
+    "loss",
+    "td_error",
+    "steps_per_sec",
+]
+
+
+class MetricsLogger:
+    """
+    Non-blocking per-episode metrics sink
+    record() only writes a row into a preallocated ring buffer, a
+    background thread appends the new rows to a CSV or JSONL file, so the
+    training loop never waits on disk or plotting
+    If the writer falls more than a full buffer behind, the oldest unwritten
+    rows are dropped and counted in 'dropped'
+    Args:
+        path - the file to append to, '.jsonl' files are written as JSON
+        lines and anything else as CSV
+        fields - the names of the recorded values
+        capacity - the number of rows the ring buffer holds
+        flush_interval - seconds between writes
+    """
+
+    def __init__(self, path, fields=FIELDS, capacity=4096, flush_interval=1.0):
+        self.path = path
+        self.fields = list(fields)
+        self.column = {field: i for i, field in enumerate(self.fields)}
+        self.jsonl = path.endswith(".jsonl")
+        self.flush_interval = flush_interval
+
+        self.buffer = np.full((capacity, len(self.fields)), np.nan)
+        self.head = 0  # rows recorded
+        self.flushed = 0  # rows taken by the writer
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if not self.jsonl and (not os.path.exists(path) or not os.path.getsize(path)):
+            with open(path, "w") as f:
+                f.write(",".join(self.fields) + "\n")
+
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, **values):
+        """
+        Record one episode, missing fields are left empty
+        Args:
+            values - the value of each field, by name
+        Returns:
+            Nothing
+        """
+        with self.lock:
+            if self.head - self.flushed == len(self.buffer):  # writer is behind
+                self.flushed += 1
+                self.dropped += 1
+            row = self.buffer[self.head % len(self.buffer)]
+            row[:] = np.nan
+            for field, value in values.items():
+                row[self.column[field]] = value
+            self.head += 1
+
+    def flush(self):
+        """
+        Append every row recorded since the last flush to the file
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        with self.write_lock:
+            with self.lock:
+                idx = np.arange(self.flushed, self.head) % len(self.buffer)
+                rows = self.buffer[idx]
+                self.flushed = self.head
+            if not len(rows):
+                return
+            with open(self.path, "a") as f:
+                f.writelines(self.format(row) for row in rows.tolist())
+
+    def format(self, row):
+        """
+        Format a row as a line of the output file
+        Args:
+            row - list of the row's values, NaN where one was not recorded
+        Returns:
+            The line, as JSON or CSV
+        """
+        if self.jsonl:
+            values = {
+                k: int(v) if v.is_integer() else v
+                for k, v in zip(self.fields, row)
+                if v == v  # skip NaN
+            }
+            return json.dumps(values) + "\n"
+        return ",".join("" if v != v else f"{v:.10g}" for v in row) + "\n"
+
+    def run(self):
+        """
+        Body of the writer thread, flushing every flush_interval seconds
+        until the logger is closed
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def close(self):
+        """
+        Write what is left and stop the writer thread
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        self.closed.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_metrics(path):
+    """
+    Load a metrics file written by MetricsLogger
+    Args:
+        path - the CSV or JSONL file
+    Returns:
+        A dictionary mapping each field to a float array, NaN where a value
+        was not recorded
+    """
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        fields = list(dict.fromkeys(k for row in rows for k in row))
+        return {
+            k: np.array([row.get(k, np.nan) for row in rows], dtype=float)
+            for k in fields
+        }
+    with open(path) as f:
+        fields = f.readline().strip().split(",")
+        rows = [line.rstrip("\n").split(",") for line in f if line.strip()]
+    columns = zip(*rows) if rows else [[] for _ in fields]
+    return {
+        k: np.array([float(v) if v else np.nan for v in col])
+        for k, col in zip(fields, columns)
+    }
+
+
+def launch_viewer(path, fields=("won", "reward"), window=100):
+    """
+    Plot a metrics file live in a separate process, see plot_helper.view
+    Args:
+        path - the metrics file
+        fields - the fields to plot
+        window - the number of episodes each point averages over
+    Returns:
+        The viewer's subprocess.Popen
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot_helper.py")
+    args = [sys.executable, script, path, "--window", str(window), "--fields"]
+    return subprocess.Popen(args + list(fields))
@@ -40,7 +40,7 @@ def run_game():
     font = pygame.font.Font(font_name, font_size)
 
     # initally draw whole board
-    images = load_images()
+    images = load_images(square_size)
     game = Minesweeper(squares, mine_cnt)
     game.draw_board(board_width, board_height, images, window, 120)
 
@@ -69,6 +69,7 @@ def run_game():
                 # getting mouse information
                 left, middle, right = pygame.mouse.get_pressed()
                 x, y = event.pos
+                rects = []  # parts of the window that changed
 
                 over = game.game_end()
                 if over == "continue":
@@ -94,10 +95,12 @@ def run_game():
                     mine_text = font.render(f"Mines: {str(mine_cnt)}", True, (0, 0, 0))
 
                     # re-render board + ui
-                    game.draw_board(board_width, board_height, images, window, 120)
+                    rects += game.draw_board(
+                        board_width, board_height, images, window, 120
+                    )
                     bar_ui.fill((255, 255, 255))
                     bar_ui.blit(mine_text, (0, bar_height / 2))
-                    window.blit(bar_ui, (0, win_height - bar_height))
+                    rects.append(window.blit(bar_ui, (0, win_height - bar_height)))
 
                 over = game.game_end()
 
@@ -150,7 +153,7 @@ def run_game():
                         restart_ui_surface, (0, 0, 0), restart_button_rect, 2
                     )
                     pygame.draw.rect(restart_ui_surface, (0, 0, 0), exit_button_rect, 2)
-                    window.blit(restart_ui_surface, (0, win_height / 4))
+                    rects.append(window.blit(restart_ui_surface, (0, win_height / 4)))
 
                     # adjustive relative positioning
                     adjusted_pos = (
@@ -164,14 +167,16 @@ def run_game():
                     if restart_button_rect.collidepoint(adjusted_pos):
                         # restart the game
                         game.restart_game()
-                        game.draw_board(board_width, board_height, images, window, 75)
+                        rects += game.draw_board(
+                            board_width, board_height, images, window, 75
+                        )
 
                     if exit_button_rect.collidepoint(adjusted_pos):
                         # quit the game
                         pygame.quit()
                         sys.exit()
 
-                pygame.display.update()
+                pygame.display.update(rects)
 
 
 def main():
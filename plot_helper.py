@@ -1,5 +1,7 @@
 # Taken from tutorial video: https://www.youtube.com/watch?v=L8ypSXwyBds
 
+import os
+import numpy as np
 import matplotlib.pyplot as plt
 from IPython import display
 
@@ -17,3 +19,47 @@ def plot(scores):
     plt.ylim(ymin=0)
     plt.text(len(scores) - 1, scores[-1], str(scores[-1]))
     plt.pause(0.05)
+
+
+def view(path, fields=("won", "reward"), window=100, interval=2.0):
+    """
+    Plot a metrics file written by metrics.MetricsLogger, rereading it
+    every interval seconds, meant to run in its own process
+    Args:
+        path - the metrics file
+        fields - the fields to plot, one subplot each
+        window - the number of episodes each point averages over
+        interval - seconds between redraws
+    Returns:
+        Nothing, runs until the window is closed
+    """
+    from metrics import read_metrics
+
+    fig, axes = plt.subplots(len(fields), 1, sharex=True, squeeze=False)
+    while plt.fignum_exists(fig.number):
+        if os.path.exists(path):
+            metrics = read_metrics(path)
+            for ax, field in zip(axes[:, 0], fields):
+                values = metrics.get(field)
+                ax.clear()
+                ax.set_ylabel(field)
+                if values is None or len(values) < window:
+                    continue
+                means = values[: len(values) // window * window]
+                means = means.reshape(-1, window)
+                ax.plot(np.nanmean(means, axis=1))
+            axes[-1, 0].set_xlabel(f"Number of Game sets (of {window})")
+            fig.suptitle("Training...")
+        plt.pause(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Live training metrics viewer")
+    parser.add_argument("path")
+    parser.add_argument("--fields", nargs="+", default=["won", "reward"])
+    parser.add_argument("--window", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=2.0)
+    args = parser.parse_args()
+    view(args.path, args.fields, args.window, args.interval)
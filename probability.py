@@ -0,0 +1,245 @@
+import numpy as np
+from collections import deque
+from math import lgamma
+from solver import Solver
+
+
+class MineProbability:
+    """
+    Exact per-square mine probabilities for a Minesweeper board
+    The unresolved frontier (squares next to revealed numbers) is split into
+    independent components. The mine configurations of each component are
+    counted by a memoized backtracking search, then the components and the
+    remaining interior squares are combined under the global mine count
+    Component results are cached, so components untouched by a move are
+    not recounted
+    Args:
+        n - the size of the board (n x n), or its first dimension if m is given
+        mine_cnt - the total number of mines
+        solver - optional Solver to share, its deductions shrink the frontier
+        before anything is counted
+        cache_size - the maximum number of cached components
+        m - optional second dimension for n x m boards, defaults to n
+    """
+
+    def __init__(self, n, mine_cnt, solver=None, cache_size=10000, m=None):
+        self.n = n
+        self.m = m if m is not None else n
+        self.mine_cnt = mine_cnt
+        if solver is None:
+            solver = Solver(n, mine_cnt, m=self.m)
+        self.solver = solver
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def update(self, board):
+        """
+        Compute the mine probability of every square
+        Args:
+            board - the board in the Minesweeper representation
+        Returns:
+            An (n, m) float array, 0 for revealed and provably safe squares,
+            1 for provable mines
+        """
+        safe, mines = self.solver.update(board)
+        probs = np.zeros((self.n, self.m))
+        for cell in mines:
+            probs[cell] = 1
+
+        components = [self.count(c) for c in self.components()]
+        frontier = set().union(*(cells for cells, _, _ in components))
+        interior = ~self.solver.known
+        for cell in frontier | safe | mines:
+            interior[cell] = False
+        interior_cnt = int(interior.sum())
+        remaining = self.mine_cnt - len(mines)
+
+        # log C(interior_cnt, j), the ways to put j mines in the interior
+        j = np.arange(remaining + 1)
+        log_ways = np.full(remaining + 1, -np.inf)
+        fits = j <= interior_cnt
+        log_ways[fits] = [
+            lgamma(interior_cnt + 1) - lgamma(k + 1) - lgamma(interior_cnt - k + 1)
+            for k in j[fits]
+        ]
+        if not np.isfinite(log_ways).any():  # inconsistent board
+            return probs
+
+        # mine count distributions of every component except the i-th,
+        # from prefix and suffix convolutions
+        dists = [ways for _, ways, _ in components]
+        prefix = [np.ones(1)]
+        for ways in dists:
+            prefix.append(normalize(np.convolve(prefix[-1], ways)))
+        suffix = [np.ones(1)]
+        for ways in reversed(dists):
+            suffix.append(normalize(np.convolve(suffix[-1], ways)))
+        suffix.reverse()
+
+        # weight of k frontier mines: the interior takes the rest
+        def interior_weights(k):
+            weights = np.zeros(k.size)
+            left = remaining - k
+            valid = left >= 0
+            weights[valid] = np.exp(log_ways[left[valid]] - log_ways.max())
+            return weights
+
+        total_dist = prefix[-1]
+        total = total_dist @ interior_weights(np.arange(total_dist.size))
+        if total <= 0:
+            return probs
+
+        for i, (cells, ways, mine_ways) in enumerate(components):
+            others = normalize(np.convolve(prefix[i], suffix[i + 1]))
+            # weight of this component holding k mines, summed over the others
+            k = np.arange(ways.size)[:, None] + np.arange(others.size)
+            weight = (others * interior_weights(k.ravel()).reshape(k.shape)).sum(1)
+            scale = ways @ weight
+            if scale <= 0:
+                continue
+            cell_probs = weight @ mine_ways / scale
+            for cell, p in zip(cells, cell_probs):
+                probs[cell] = p
+
+        if interior_cnt:
+            k = np.arange(total_dist.size)
+            left = remaining - k
+            expected = total_dist * interior_weights(k) * np.maximum(left, 0)
+            probs[interior] = expected.sum() / total / interior_cnt
+        return probs
+
+    def components(self):
+        """
+        Split the solver's constraints into independent groups, two
+        constraints being connected if they share a square
+        Args:
+            None
+        Returns:
+            A list of sorted lists of (cells, remaining) constraints, cells
+            being sorted tuples so equal components compare equal
+        """
+        constraints = self.solver.constraints
+        unvisited = set(constraints)
+        groups = []
+        while unvisited:
+            key = unvisited.pop()
+            group, queue = [key], deque([key])
+            while queue:
+                for cell in constraints[queue.popleft()][0]:
+                    for other in self.solver.cell_constraints[cell]:
+                        if other in unvisited:
+                            unvisited.discard(other)
+                            group.append(other)
+                            queue.append(other)
+            groups.append(
+                sorted(
+                    (tuple(sorted(constraints[k][0])), constraints[k][1]) for k in group
+                )
+            )
+        return groups
+
+    def count(self, constraints):
+        """
+        Count the mine configurations of a component, from the cache when
+        the same component has been counted before
+        Args:
+            constraints - list of (cells, remaining) constraints
+        Returns:
+            A tuple (cells, ways, mine_ways): ways[k] is proportional to the
+            number of configurations with k mines, mine_ways[k][c] to those
+            where cells[c] is also a mine
+        """
+        key = tuple(constraints)
+        if key not in self.cache:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = enumerate_component(constraints)
+        return self.cache[key]
+
+
+def enumerate_component(constraints):
+    """
+    Count the mine configurations of a component by backtracking over its
+    squares, memoized on the position and the constraints' remaining counts
+    Args:
+        constraints - list of (cells, remaining) constraints
+    Returns:
+        See MineProbability.count
+    """
+    # order squares breadth first, so constraints close soon after they open
+    cell_constraints = {}
+    for c, (cells, _) in enumerate(constraints):
+        for cell in cells:
+            cell_constraints.setdefault(cell, []).append(c)
+    order = []
+    seen = set()
+    for start in sorted(cell_constraints):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            order.append(cell)
+            for c in cell_constraints[cell]:
+                for other in constraints[c][0]:
+                    if other not in seen:
+                        seen.add(other)
+                        queue.append(other)
+
+    size = len(order)
+    position = {cell: i for i, cell in enumerate(order)}
+    touches = [cell_constraints[cell] for cell in order]
+    # left[c][i] - squares of constraint c after position i
+    left = []
+    for cells, _ in constraints:
+        after = np.zeros(size + 1, dtype=int)
+        for cell in cells:
+            after[: position[cell]] += 1
+        left.append(after.tolist())
+
+    memo = {}
+
+    def search(i, remaining):
+        if i == size:
+            return np.ones(1), np.zeros((1, size))
+        key = (i, remaining)
+        if key in memo:
+            return memo[key]
+        ways = np.zeros(size - i + 1)
+        mine_ways = np.zeros((size - i + 1, size))
+        for is_mine in (0, 1):
+            nxt = list(remaining)
+            feasible = True
+            for c in touches[i]:
+                nxt[c] -= is_mine
+                if not 0 <= nxt[c] <= left[c][i]:
+                    feasible = False
+                    break
+            if not feasible:
+                continue
+            sub_ways, sub_mine_ways = search(i + 1, tuple(nxt))
+            k = np.arange(sub_ways.size) + is_mine
+            ways[k] += sub_ways
+            mine_ways[k] += sub_mine_ways
+            if is_mine:
+                mine_ways[k, i] += sub_ways
+        memo[key] = (ways, mine_ways)
+        return memo[key]
+
+    ways, mine_ways = search(0, tuple(remaining for _, remaining in constraints))
+    scale = ways.max() if ways.max() > 0 else 1  # keep numbers in range
+    return order, ways / scale, mine_ways / scale
+
+
+def normalize(dist):
+    """
+    Scale a distribution so its largest entry is 1, keeping products of
+    many components in floating point range
+    Args:
+        dist - array of non-negative counts, e.g. ways per number of mines
+    Returns:
+        The scaled array, unchanged if it is all zeros
+    """
+    peak = dist.max()
+    return dist / peak if peak > 0 else dist
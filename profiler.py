@@ -0,0 +1,266 @@
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+import numpy as np
+
+# latency histograms: 8 log-spaced buckets per power of two, from 1 ns,
+# merged by summing counts
+BUCKETS_PER_OCTAVE = 8
+NUM_BUCKETS = 40 * BUCKETS_PER_OCTAVE
+
+# shared by every disabled phase, so switched off timers cost one call
+NULL_PHASE = nullcontext()
+
+
+def latency_histogram(latencies):
+    """
+    Bucket latencies on a log scale
+    Args:
+        latencies - array of latencies in nanoseconds
+    Returns:
+        An array of NUM_BUCKETS counts
+    """
+    latencies = np.maximum(np.asarray(latencies, dtype=np.float64), 1)
+    buckets = np.floor(np.log2(latencies) * BUCKETS_PER_OCTAVE).astype(np.int64)
+    buckets = np.clip(buckets, 0, NUM_BUCKETS - 1)
+    return np.bincount(buckets, minlength=NUM_BUCKETS)
+
+
+def percentile(histogram, q):
+    """
+    Estimate a percentile from a latency histogram
+    Args:
+        histogram - bucket counts, see latency_histogram
+        q - the percentile, 0 to 100
+    Returns:
+        The upper edge of the bucket holding the percentile, in nanoseconds
+    """
+    total = histogram.sum()
+    if total == 0:
+        return 0.0
+    bucket = int(np.searchsorted(np.cumsum(histogram), q / 100 * total))
+    return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE)
+
+
+class Phase:
+    """
+    Times one run of a phase, see PhaseTimer.phase
+    """
+
+    __slots__ = ("timer", "name", "start", "label")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.label = None
+
+    def __enter__(self):
+        if self.timer.record_function is not None:
+            self.label = self.timer.record_function(self.name)
+            self.label.__enter__()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer.sync is not None:
+            self.timer.sync()  # wait for queued GPU work
+        self.timer.samples[self.name].append(time.perf_counter_ns() - self.start)
+        if self.label is not None:
+            self.label.__exit__(*exc)
+
+
+class PhaseTimer:
+    """
+    Low overhead wall clock timers around the phases of a training loop
+    Each run of a phase appends one integer, histograms are only built when
+    a report is asked for. A disabled timer hands out a shared no-op context
+    Args:
+        enabled - T/F if phases are timed
+        sync - optional function called before a phase is stopped, e.g.
+        torch.cuda.synchronize so GPU work is charged to the right phase
+        label - T/F if phases are also marked with torch.profiler's
+        record_function, so they show up in torch traces
+    """
+
+    def __init__(self, enabled=True, sync=None, label=False):
+        self.enabled = enabled
+        self.sync = sync
+        self.record_function = None
+        if label:
+            from torch.profiler import record_function
+
+            self.record_function = record_function
+        self.samples = defaultdict(list)
+        self.since = time.perf_counter_ns()
+
+    def phase(self, name):
+        """
+        Time a phase
+        Args:
+            name - the name of the phase
+        Returns:
+            A context manager timing its body
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def summary(self, reset=True):
+        """
+        Summarize every phase timed since the last reset
+        Args:
+            reset - T/F if the samples are cleared afterwards
+        Returns:
+            A dictionary mapping each phase to its calls, total_ms, share of
+            the wall time since the last reset, mean_us, p50_us, p99_us and
+            latency histogram
+        """
+        wall = max(time.perf_counter_ns() - self.since, 1)
+        stats = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            samples = np.array(samples, dtype=np.int64)
+            histogram = latency_histogram(samples)
+            stats[name] = {
+                "calls": samples.size,
+                "total_ms": samples.sum() / 1e6,
+                "share": samples.sum() / wall,
+                "mean_us": samples.mean() / 1e3,
+                "p50_us": percentile(histogram, 50) / 1e3,
+                "p99_us": percentile(histogram, 99) / 1e3,
+                "histogram": histogram,
+            }
+        if reset:
+            self.samples.clear()
+            self.since = time.perf_counter_ns()
+        return stats
+
+    def report(self, reset=True):
+        """
+        Summarize every phase as a printable table with a coarse latency
+        histogram per phase, one column per power of four from 1 us
+        Phases nest, e.g. the trainer's forward is part of train_short_memory,
+        so shares don't add up to 100%
+        Args:
+            reset - T/F if the samples are cleared afterwards
+        Returns:
+            The table as a string
+        """
+        stats = self.summary(reset)
+        lines = [
+            f"{'phase':<20}{'calls':>8}{'total ms':>11}{'share':>7}"
+            f"{'mean us':>10}{'p50 us':>10}{'p99 us':>10}  histogram (1us, x4)"
+        ]
+        levels = " .:-=+*#%@"
+        for name, s in sorted(stats.items(), key=lambda kv: -kv[1]["total_ms"]):
+            # regroup into powers of four, starting at 1 us (2^10 ns)
+            counts = s["histogram"][10 * BUCKETS_PER_OCTAVE :]
+            counts = np.add.reduceat(
+                counts, np.arange(0, counts.size, 2 * BUCKETS_PER_OCTAVE)
+            )[:12]
+            counts[0] += s["histogram"][: 10 * BUCKETS_PER_OCTAVE].sum()
+            shade = np.ceil(counts / counts.max() * (len(levels) - 1)).astype(int)
+            lines.append(
+                f"{name:<20}{s['calls']:>8}{s['total_ms']:>11.1f}"
+                f"{s['share']:>7.1%}{s['mean_us']:>10.1f}"
+                f"{s['p50_us']:>10.1f}{s['p99_us']:>10.1f}  "
+                + "".join(levels[i] for i in shade)
+            )
+        return "\n".join(lines)
+
+
+# the default timer of objects that aren't given one, never times anything
+DISABLED = PhaseTimer(enabled=False)
+
+
+class Trace:
+    """
+    Optional whole-program trace around a training run
+    Args:
+        kind - None for no trace, 'cprofile' for a cProfile dump readable
+        by pstats or snakeviz, or 'torch' for a torch.profiler Chrome trace
+        path - the file the trace is written to
+        steps - torch traces only record this many steps (see step), after
+        one warmup step, as they grow by megabytes per step
+    """
+
+    def __init__(self, kind=None, path="profile", steps=20):
+        self.kind = kind
+        self.path = path
+        self.profiler = None
+        self.written = False
+        if kind == "cprofile":
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        elif kind == "torch":
+            import torch
+
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(
+                    wait=0, warmup=1, active=steps, repeat=1
+                ),
+                on_trace_ready=self.export,
+            )
+        elif kind is not None:
+            raise ValueError(f"Unknown trace type: {kind}")
+
+    def start(self):
+        """
+        Start tracing
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        if self.kind == "cprofile":
+            self.profiler.enable()
+        elif self.kind == "torch":
+            self.profiler.start()
+
+    def step(self):
+        """
+        Mark the end of a step, e.g. a game, for the torch trace's schedule
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        if self.kind == "torch":
+            self.profiler.step()
+
+    def export(self, profiler):
+        """
+        Write a finished torch trace to path, called by torch.profiler once
+        the scheduled steps are recorded
+        Args:
+            profiler - the torch.profiler.profile that finished
+        Returns:
+            Nothing
+        """
+        profiler.export_chrome_trace(self.path)
+        self.written = True
+
+    def stop(self):
+        """
+        Stop tracing and write the trace to path
+        Args:
+            None
+        Returns:
+            The file written, None if there is no trace
+        """
+        if self.kind == "cprofile":
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+        elif self.kind == "torch":
+            self.profiler.stop()
+            if not self.written:
+                return None
+        else:
+            return None
+        return self.path
@@ -0,0 +1,279 @@
+import numpy as np
+import torch as T
+
+
+class ReplayBuffer:
+    def __init__(self, capacity, state_shape, device, state_dtype=np.int8, rng=None):
+        """
+        Replay memory backed by preallocated arrays, used as a ring buffer
+        Args:
+            capacity - the maximum number of transitions stored
+            state_shape - the shape of a single state
+            device - the device sampled batches are moved to
+            state_dtype - the dtype states are stored as, the board
+            representation fits in int8
+            rng - optional numpy.random.Generator used for sampling
+        """
+        self.capacity = capacity
+        self.device = device
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.states = np.zeros((capacity, *state_shape), dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, *state_shape), dtype=state_dtype)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.pos = 0  # where the next transition is written
+        self.size = 0
+
+    def __len__(self):
+        """
+        The number of transitions stored
+        Args:
+            None
+        Returns:
+            The number of transitions, at most capacity
+        """
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Store a single transition, overwriting the oldest one if full
+        Args:
+            state - the current state
+            action - the action taken at 'state'
+            reward - the reward recieved at 'state'
+            next_state - the state reached by taking 'action' at 'state'
+            done - T/F if transitioned to terminal state
+        Returns:
+            The index the transition was stored at
+        """
+        i = self.pos
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Store a batch of transitions at once
+        Args:
+            states, actions, rewards, next_states, dones - arrays with
+            one entry per transition
+        Returns:
+            The indices the transitions were stored at
+        """
+        idx = (self.pos + np.arange(len(actions))) % self.capacity
+        if idx.size == 0:
+            return idx
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.pos = int(idx[-1] + 1) % self.capacity
+        self.size = min(self.size + len(idx), self.capacity)
+        return idx
+
+    def sample_indices(self, batch_size):
+        """
+        Pick which transitions go into a batch
+        Args:
+            batch_size - the number of transitions to sample
+        Returns:
+            An array of indices, all stored transitions if there are
+            fewer than batch_size of them
+        """
+        if self.size > batch_size:
+            return self.rng.choice(self.size, batch_size, replace=False)
+        return np.arange(self.size)
+
+    def gather(self, idx):
+        """
+        Gather transitions into batched tensors on the device
+        Args:
+            idx - the indices of the transitions
+        Returns:
+            A tuple of tensors (states, actions, rewards, next_states, dones)
+        """
+        return (
+            T.from_numpy(self.states[idx]).to(self.device, T.float),
+            T.from_numpy(self.actions[idx]).to(self.device),
+            T.from_numpy(self.rewards[idx]).to(self.device),
+            T.from_numpy(self.next_states[idx]).to(self.device, T.float),
+            T.from_numpy(self.dones[idx]).to(self.device),
+        )
+
+    def sample(self, batch_size):
+        """
+        Sample a training batch uniformly
+        Args:
+            batch_size - the number of transitions to sample
+        Returns:
+            A tuple of tensors (states, actions, rewards, next_states, dones)
+        """
+        return self.gather(self.sample_indices(batch_size))
+
+
+class SumTree:
+    def __init__(self, capacity):
+        """
+        Binary tree where every node holds the sum of its children,
+        giving O(log N) priority updates and proportional sampling
+        Args:
+            capacity - the number of leaves
+        """
+        self.capacity = capacity
+        self.leaf_start = 1
+        while self.leaf_start < capacity:  # leaves start at a power of two
+            self.leaf_start *= 2
+        self.depth = self.leaf_start.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_start, dtype=np.float64)
+
+    def total(self):
+        """
+        The sum of every priority
+        Args:
+            None
+        Returns:
+            The priority stored at the root
+        """
+        return self.tree[1]
+
+    def get(self, idx):
+        """
+        The priorities stored at leaves idx
+        Args:
+            idx - array of leaf indices
+        Returns:
+            An array of priorities
+        """
+        return self.tree[self.leaf_start + idx]
+
+    def update(self, idx, priorities):
+        """
+        Set the priorities of leaves idx and refresh their ancestors
+        Args:
+            idx - array of leaf indices
+            priorities - array of new priorities
+        Returns:
+            Nothing
+        """
+        nodes = self.leaf_start + np.asarray(idx)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Walk down the tree to find the leaf each prefix sum falls in
+        Args:
+            values - array of prefix sums in [0, total)
+        Returns:
+            An array of leaf indices
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(values.size, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return np.minimum(nodes - self.leaf_start, self.capacity - 1)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(
+        self,
+        capacity,
+        state_shape,
+        device,
+        alpha=0.6,
+        beta=0.4,
+        beta_increment=1e-4,
+        eps=1e-5,
+        **kwargs
+    ):
+        """
+        Replay memory that samples transitions in proportion to their TD error
+        Args:
+            capacity, state_shape, device - see ReplayBuffer
+            alpha - how strongly priorities skew sampling (0 is uniform)
+            beta - importance sampling correction, annealed towards 1
+            beta_increment - how much beta grows per sampled batch
+            eps - added to TD errors so no transition gets zero priority
+        """
+        super().__init__(capacity, state_shape, device, **kwargs)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0  # new transitions are sampled at least once
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        Store a single transition at the highest priority seen so far
+        Args:
+            state, action, reward, next_state, done - see ReplayBuffer.add
+        Returns:
+            The index the transition was stored at
+        """
+        i = super().add(state, action, reward, next_state, done)
+        self.tree.update([i], self.max_priority**self.alpha)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Store a batch of transitions at the highest priority seen so far
+        Args:
+            states, actions, rewards, next_states, dones - see
+            ReplayBuffer.add_batch
+        Returns:
+            The indices the transitions were stored at
+        """
+        idx = super().add_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority**self.alpha)
+        return idx
+
+    def sample(self, batch_size):
+        """
+        Sample a training batch by priority, one draw per equal-sized
+        segment of the total priority
+        Args:
+            batch_size - the number of transitions to sample
+        Returns:
+            A tuple of tensors (states, actions, rewards, next_states, dones,
+            weights) and the array of sampled indices, needed to update
+            their priorities
+        """
+        batch_size = min(batch_size, self.size)
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        # importance sampling weights, normalized so the largest is 1
+        probs = self.tree.get(idx) / self.tree.total()
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        weights = T.from_numpy(weights).to(self.device, T.float)
+        return self.gather(idx) + (weights,), idx
+
+    def update_priorities(self, idx, td_errors):
+        """
+        Set new priorities from the TD errors of a trained batch
+        Args:
+            idx - the indices returned by sample
+            td_errors - array of TD errors, one per index
+        Returns:
+            Nothing
+        """
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities**self.alpha)
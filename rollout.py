@@ -0,0 +1,260 @@
+import os
+import copy
+import time
+import numpy as np
+import torch as T
+import torch.multiprocessing as mp
+from queue import Empty, Full
+from game import Minesweeper
+from agent import Agent
+from metrics import MetricsLogger
+
+
+def rollout_worker(
+    worker_id,
+    seed,
+    agent_args,
+    mine_cnt,
+    shared_model,
+    epsilon,
+    transitions,
+    stop,
+    sync_freq,
+):
+    """
+    Actor process: plays games with a local copy of the model and pushes
+    every finished game's transitions onto the shared queue
+    Args:
+        worker_id - index of the worker
+        seed - the worker's numpy.random.SeedSequence, seeding its games
+        and its exploration
+        agent_args - keyword arguments used to build the local agent
+        mine_cnt - the number of mines
+        shared_model - the learner's model, kept in shared memory
+        epsilon - shared value holding the learner's exploration rate
+        transitions - queue the transitions are pushed onto
+        stop - event set by the learner when training is over
+        sync_freq - how often the local model is synced (in games)
+    Returns:
+        Nothing
+    """
+    T.set_num_threads(1)  # one core per worker
+    np.random.seed(seed.generate_state(1))  # Agent.get_action explores with it
+    agent = Agent(**agent_args)
+    n = agent.n
+    game = Minesweeper(n, mine_cnt, rng=np.random.default_rng(seed))
+
+    n_games = 0
+    while not stop.is_set():
+        if n_games % sync_freq == 0:
+            agent.model.load_state_dict(shared_model.state_dict())
+        agent.epsilon = epsilon.value
+
+        # play out an entire game
+        episode = []
+        done = False
+        state_curr = agent.get_state(game)
+        while not done:
+            final_action = agent.get_action(state_curr, game)
+            reward, done, score = game.play((final_action // n, final_action % n))
+            state_new = agent.get_state(game)
+            episode.append((state_curr, final_action, reward, state_new, done))
+            state_curr = state_new
+        game.restart_game()
+        n_games += 1
+
+        # games are small, so pickled arrays are cheaper than shared memory
+        # tensors, which cost a file descriptor each
+        states, actions, rewards, next_states, dones = zip(*episode)
+        batch = (
+            np.array(states),
+            np.array(actions),
+            np.array(rewards, dtype=np.float32),
+            np.array(next_states),
+            np.array(dones),
+            score,
+        )
+        while not stop.is_set():
+            try:
+                transitions.put(batch, timeout=1)
+                break
+            except Full:
+                continue
+
+
+def train_parallel(
+    num_workers=None,
+    n=5,
+    mine_cnt=2,
+    sync_freq=10,
+    max_games=None,
+    network="linear",
+    metrics_path="metrics/train_parallel.csv",
+    seed=None,
+    gradient_steps=1,
+    replay_ratio=None,
+):
+    """
+    Actor/learner training: num_workers processes generate games while
+    this process consumes their transitions and trains the agent
+    Gradient steps are decoupled from game arrival: each round the learner
+    moves every finished game into replay memory, then trains on replay
+    mini-batches, so workers never wait on a gradient step
+    Args:
+        num_workers - the number of rollout processes, defaults to one
+        per core, minus one for the learner
+        n - the size of the board (lengthwise)
+        mine_cnt - the number of mines
+        sync_freq - how often the workers sync their model (in games)
+        max_games - stop after this many games, train forever if None
+        network - the agent's network type, see Agent
+        metrics_path - file every game's metrics are written to, see
+        metrics.py, steps_per_sec being the learner's throughput
+        seed - the run's seed, each worker gets its own child seed from a
+        numpy.random.SeedSequence, None picks a fresh one
+        gradient_steps - mini-batches trained on per round, however many
+        games arrived
+        replay_ratio - if given, overrides gradient_steps so each move is
+        trained on replay_ratio times on average, which ties learning to
+        the workers' speed again
+    Returns:
+        Nothing
+    """
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 2) - 1)
+    agent_args = dict(
+        eps_start=1,
+        eps_end=0.001,
+        gamma=0,
+        max_mem=10000,
+        batch_size=128,
+        lr=0.01,
+        n=n,
+        network=network,
+    )
+    agent = Agent(**agent_args)
+
+    # weights the workers copy from, living in shared memory
+    shared_model = copy.deepcopy(agent.model).cpu()
+    shared_model.share_memory()
+
+    ctx = mp.get_context("spawn")
+    epsilon = ctx.Value("d", agent.epsilon)
+    transitions = ctx.Queue(maxsize=16 * num_workers)
+    stop = ctx.Event()
+    seeds = np.random.SeedSequence(seed).spawn(num_workers)
+    workers = [
+        ctx.Process(
+            target=rollout_worker,
+            args=(
+                i,
+                seeds[i],
+                agent_args,
+                mine_cnt,
+                shared_model,
+                epsilon,
+                transitions,
+                stop,
+                sync_freq,
+            ),
+            daemon=True,
+        )
+        for i in range(num_workers)
+    ]
+    for w in workers:
+        w.start()
+
+    # keeping track of training, written out by a background thread
+    metrics = MetricsLogger(metrics_path)
+    wins = 0
+    reward_tot = 0
+    record = 0
+    synced = 0
+    owed = 0.0
+    loss = td_error = None
+    last = time.perf_counter()
+    try:
+        while max_games is None or agent.n_games < max_games:
+            # take every finished game, waiting for the first one when this
+            # round would have no gradient steps to do without it
+            idle = len(agent.memory) == 0 or (replay_ratio is not None and owed < 1)
+            games = []
+            try:
+                if idle:
+                    games.append(transitions.get(timeout=1))
+                while True:
+                    games.append(transitions.get_nowait())
+            except Empty:
+                if not games and idle:
+                    if not any(w.is_alive() for w in workers):
+                        raise RuntimeError("All rollout workers have exited")
+                    continue
+
+            # throughput since the last round that received games
+            moves = sum(len(game[1]) for game in games)
+            if games:
+                now = time.perf_counter()
+                steps_per_sec = moves / (now - last) if now > last else 0
+                last = now
+            for states, actions, rewards, next_states, dones, score in games:
+                agent.memory.add_batch(states, actions, rewards, next_states, dones)
+                agent.n_games += 1
+                agent.decay_epsilon()
+                reward_tot += rewards.sum().item()
+
+                # book keeping
+                if score > record:
+                    record = score
+                    agent.model.save()
+
+                won = score == n**2 - mine_cnt
+                if won:
+                    wins += 1
+
+                metrics.record(
+                    episode=agent.n_games,
+                    reward=rewards.sum().item(),
+                    score=score,
+                    length=len(actions),
+                    won=won,
+                    epsilon=agent.epsilon,
+                    loss=loss,
+                    td_error=td_error,
+                    steps_per_sec=steps_per_sec,
+                )
+
+                if agent.n_games % 100 == 0:
+                    print(f"Win rate over this set: {wins / 100}")
+                    print(f"Average reward over this set: {reward_tot / 100}")
+                    print(f"Epsilon value: {agent.epsilon}")
+                    wins = 0
+                    reward_tot = 0
+            epsilon.value = agent.epsilon
+
+            # train on replay mini-batches
+            if replay_ratio is None:
+                owed = gradient_steps
+            else:
+                owed += replay_ratio * moves / agent.batch_size
+            for _ in range(int(owed)):
+                td_errors = agent.train_batch()
+            if int(owed):
+                loss = (td_errors**2).mean().item()
+                td_error = td_errors.abs().mean().item()
+            owed -= int(owed)
+
+            # let the workers pick up the new weights
+            if agent.n_games - synced >= sync_freq:
+                synced = agent.n_games
+                shared_model.load_state_dict(agent.model.state_dict())
+    finally:
+        metrics.close()
+        stop.set()
+        for w in workers:
+            w.join(timeout=5)
+            if w.is_alive():
+                w.terminate()
+
+
+if __name__ == "__main__":
+    train_parallel()
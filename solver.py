@@ -0,0 +1,547 @@
+import numpy as np
+from collections import defaultdict, deque
+from game import NEIGHBOR_DX, NEIGHBOR_DY
+
+
+class Solver:
+    """
+    Deterministic Minesweeper solver finding every square that is provably
+    safe or provably a mine
+    Each revealed number becomes a constraint: its unresolved neighbors hold
+    exactly 'remaining' mines. Constraints are resolved with single-cell
+    rules, pair (and subset) reasoning, and, when those stall, Gaussian
+    elimination, then exact enumeration, over each group of connected
+    constraints that changed
+    The solver is incremental: update only processes newly revealed squares
+    and the constraints they touch, and only re-examines the groups of
+    constraints that changed
+    The global mine count is used once it can rule something out, by
+    combining the number of mines each group can hold. Deductions are
+    complete, except for groups larger than exact_limit squares, which
+    are only eliminated
+    Args:
+        n - the size of the board (n x n), or its first dimension if m is given
+        mine_cnt - optional total number of mines, adds a global constraint
+        use_linear - T/F if elimination and enumeration are used when the
+        local rules stall
+        m - optional second dimension for n x m boards, defaults to n
+        exact_limit - the largest group of squares that is enumerated
+    """
+
+    def __init__(
+        self,
+        n,
+        mine_cnt=None,
+        use_linear=True,
+        m=None,
+        exact_limit=48,
+    ):
+        self.n = n
+        self.m = m if m is not None else n
+        self.mine_cnt = mine_cnt
+        self.use_linear = use_linear
+        self.exact_limit = exact_limit
+        self.exact_cache = {}  # group of constraints -> enumerate_component result
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything, e.g. for a new game
+        Args:
+            None
+        Returns:
+            Nothing
+        """
+        self.known = np.zeros((self.n, self.m), dtype=bool)  # revealed squares
+        self.safe = set()  # provably safe, unrevealed squares
+        self.mines = set()  # provable mines
+        self.constraints = {}  # revealed square -> (unresolved neighbors, mines)
+        self.cell_constraints = defaultdict(set)  # square -> constraints it is in
+        self.dirty = set()  # constraints changed since they were last eliminated
+        self.global_dirty = False  # T/F if anything changed since the endgame check
+        self.unknown_cnt = self.n * self.m  # unrevealed squares
+
+    def neighbors(self, x, y):
+        """
+        The squares neighboring (x, y)
+        Args:
+            x - the x index
+            y - the y index
+        Returns:
+            A list of (x, y) tuples
+        """
+        return [
+            (x + dx, y + dy)
+            for dx, dy in zip(NEIGHBOR_DX.tolist(), NEIGHBOR_DY.tolist())
+            if 0 <= x + dx < self.n and 0 <= y + dy < self.m
+        ]
+
+    def update(self, board):
+        """
+        Take in newly revealed squares and deduce what follows from them
+        Args:
+            board - the board in the Minesweeper representation, only
+            revealed squares (0..8) are read
+        Returns:
+            A tuple of the sets (safe, mines) of (x, y) squares
+        """
+        board = np.asarray(board)
+        revealed = board >= 0
+        if (self.known & ~revealed).any():  # a new game has started
+            self.reset()
+
+        new_cells = [(int(x), int(y)) for x, y in np.argwhere(revealed & ~self.known)]
+        self.known |= revealed
+        self.unknown_cnt -= len(new_cells)
+        self.global_dirty |= bool(new_cells)
+        work = deque()
+
+        # revealed squares are safe, so they leave every constraint they are in
+        for cell in new_cells:
+            self.safe.discard(cell)
+            self.remove(cell, False, work)
+
+        # and add a constraint of their own
+        for x, y in new_cells:
+            cells = []
+            remaining = int(board[x, y])
+            for cell in self.neighbors(x, y):
+                if revealed[cell] or cell in self.safe:
+                    continue
+                if cell in self.mines:
+                    remaining -= 1
+                else:
+                    cells.append(cell)
+            if cells:
+                self.add((x, y), frozenset(cells), remaining, work)
+
+        self.propagate(work)
+        return self.safe, self.mines
+
+    def risk(self, cell):
+        """
+        Quick estimate of the chance that a square is a mine: the worst
+        density among the constraints it is in, or the density of the
+        unresolved squares if it isn't next to any number
+        Args:
+            cell - the (x, y) square
+        Returns:
+            A probability estimate, see probability.py for exact ones
+        """
+        if cell in self.mines:
+            return 1.0
+        if cell in self.safe or self.known[cell]:
+            return 0.0
+        keys = self.cell_constraints.get(cell)
+        if keys:
+            return max(
+                self.constraints[k][1] / len(self.constraints[k][0]) for k in keys
+            )
+        if self.mine_cnt is None:
+            return 0.5
+        return (self.mine_cnt - len(self.mines)) / max(self.unresolved(), 1)
+
+    def unresolved(self):
+        """
+        The number of unrevealed squares not yet proven safe or a mine
+        Args:
+            None
+        Returns:
+            The count
+        """
+        return self.unknown_cnt - len(self.safe) - len(self.mines)
+
+    def add(self, key, cells, remaining, work):
+        """
+        Add a constraint and queue it for checking
+        Args:
+            key - the revealed (x, y) square the constraint comes from
+            cells - frozenset of its unresolved neighbors
+            remaining - the number of mines among them
+            work - queue of constraints that changed
+        Returns:
+            Nothing
+        """
+        self.constraints[key] = (cells, remaining)
+        for cell in cells:
+            self.cell_constraints[cell].add(key)
+        work.append(key)
+        self.dirty.add(key)
+        self.global_dirty = True
+
+    def delete(self, key):
+        """
+        Delete a constraint
+        Args:
+            key - the revealed (x, y) square the constraint comes from
+        Returns:
+            Nothing
+        """
+        cells, _ = self.constraints.pop(key)
+        for cell in cells:
+            self.cell_constraints[cell].discard(key)
+        self.dirty.discard(key)
+
+    def remove(self, cell, is_mine, work):
+        """
+        Take a resolved square out of every constraint it is in, queueing
+        those constraints for checking
+        Args:
+            cell - the resolved (x, y) square
+            is_mine - T/F if the square is a mine
+            work - queue of constraints that changed
+        Returns:
+            Nothing
+        """
+        for key in self.cell_constraints.pop(cell, ()):
+            cells, remaining = self.constraints[key]
+            self.constraints[key] = (cells - {cell}, remaining - is_mine)
+            work.append(key)
+            self.dirty.add(key)
+        self.global_dirty = True
+
+    def resolve(self, cells, is_mine, work):
+        """
+        Record squares as provably mines or provably safe
+        Args:
+            cells - iterable of (x, y) squares
+            is_mine - T/F if the squares are mines
+            work - queue of constraints that changed
+        Returns:
+            Nothing
+        """
+        found = self.mines if is_mine else self.safe
+        for cell in cells:
+            if cell not in self.safe and cell not in self.mines:
+                found.add(cell)
+                self.remove(cell, is_mine, work)
+
+    def propagate(self, work):
+        """
+        Apply the rules until nothing more can be deduced
+        Args:
+            work - queue of constraints that changed
+        Returns:
+            Nothing
+        """
+        while True:
+            while work:
+                key = work.popleft()
+                if key not in self.constraints:
+                    continue
+                cells, remaining = self.constraints[key]
+                # single-cell rules: no mines left, or every square is a mine
+                if remaining == 0 or remaining == len(cells):
+                    self.delete(key)
+                    self.resolve(cells, remaining > 0, work)
+                else:
+                    self.pair(key, work)
+            if self.use_linear and self.dirty and self.linear(work):
+                continue
+            if self.mine_cnt is not None and self.global_dirty and self.endgame(work):
+                continue
+            return
+
+    def pair(self, key, work):
+        """
+        Compare a constraint with every constraint it overlaps
+        If A has |A - B| more mines than B, the squares only in A are all
+        mines and the squares only in B are all safe (subsets are the case
+        where one of those differences is empty)
+        Args:
+            key - the constraint to compare
+            work - queue of constraints that changed
+        Returns:
+            Nothing
+        """
+        cells, _ = self.constraints[key]
+        others = set().union(*(self.cell_constraints[c] for c in cells))
+        others.discard(key)
+        for other in others:
+            if key not in self.constraints or other not in self.constraints:
+                continue
+            cells_a, remaining_a = self.constraints[key]
+            cells_b, remaining_b = self.constraints[other]
+            only_a, only_b = cells_a - cells_b, cells_b - cells_a
+            if remaining_a - remaining_b == len(only_a):
+                self.resolve(only_a, True, work)
+                self.resolve(only_b, False, work)
+            elif remaining_b - remaining_a == len(only_b):
+                self.resolve(only_b, True, work)
+                self.resolve(only_a, False, work)
+
+    def components(self, keys):
+        """
+        Group constraints that share squares, starting from the given ones
+        Args:
+            keys - the constraints to start from
+        Returns:
+            A list of lists of constraints, one per group reached
+        """
+        unvisited = set(keys)
+        seen = set()
+        groups = []
+        while unvisited:
+            key = unvisited.pop()
+            if key in seen or key not in self.constraints:
+                continue
+            seen.add(key)
+            group, queue = [key], deque([key])
+            while queue:
+                for cell in self.constraints[queue.popleft()][0]:
+                    for other in self.cell_constraints[cell]:
+                        if other not in seen:
+                            seen.add(other)
+                            group.append(other)
+                            queue.append(other)
+            groups.append(group)
+        return groups
+
+    def linear(self, work):
+        """
+        Examine every group of constraints that changed: reduce it to row
+        echelon form and apply bound reasoning to each row, and enumerate
+        it exactly if that finds nothing
+        Args:
+            work - queue of constraints that changed
+        Returns:
+            T/F if anything new was deduced
+        """
+        groups = self.components(self.dirty)
+        self.dirty = set()
+        found = len(self.safe) + len(self.mines)
+        for group in groups:
+            # groups are independent, earlier deductions can't touch this one
+            rows = [self.constraints[k] for k in group]
+            mines, safe = eliminate(rows)
+            if not mines and not safe:
+                mines, safe = self.exact(rows)
+            self.resolve(mines, True, work)
+            self.resolve(safe, False, work)
+        return len(self.safe) + len(self.mines) > found
+
+    def table(self, rows):
+        """
+        Count the mine configurations of a group of constraints, see
+        probability.enumerate_component, from the cache when the same group
+        has been counted before
+        Args:
+            rows - list of (cells, remaining) constraints
+        Returns:
+            A tuple (cells, ways, mine_ways), None if the group has more than
+            exact_limit squares
+        """
+        from probability import enumerate_component  # it imports this module
+
+        constraints = sorted((tuple(sorted(c)), r) for c, r in rows)
+        key = tuple(constraints)
+        if key not in self.exact_cache:
+            if len(set().union(*(c for c, _ in constraints))) > self.exact_limit:
+                return None
+            if len(self.exact_cache) >= 10000:
+                self.exact_cache.clear()
+            self.exact_cache[key] = enumerate_component(constraints)
+        return self.exact_cache[key]
+
+    def exact(self, rows):
+        """
+        Enumerate every mine configuration of a group of constraints, a
+        square is safe (or a mine) if it is in none (or all) of them
+        Args:
+            rows - list of (cells, remaining) constraints
+        Returns:
+            A tuple of the lists (mines, safe) of (x, y) squares
+        """
+        table = self.table(rows)
+        if table is None:
+            return [], []
+        order, ways, mine_ways = table
+        return settle(order, ways, mine_ways, ways > 0)
+
+    def endgame(self, work):
+        """
+        Use the global mine count: if no mines are left, or every unresolved
+        square must be one, they all are resolved. Otherwise each group only
+        keeps the mine totals that, with some totals of the other groups,
+        leave the squares next to no number between none and all of the
+        remaining mines. This is skipped when those squares always get some
+        but never all of them, as the count then rules nothing out
+        Args:
+            work - queue of constraints that changed
+        Returns:
+            T/F if anything new was deduced
+        """
+        self.global_dirty = False
+        unresolved = self.unresolved()
+        remaining = self.mine_cnt - len(self.mines)
+        if unresolved == 0:
+            return False
+        if 0 < remaining < unresolved:
+            if not self.use_linear:
+                return False
+            # bounds on the frontier's mines: at least the largest count of a
+            # constraint, at most the sum of every count
+            frontier = sum(1 for keys in self.cell_constraints.values() if keys)
+            counts = [r for _, r in self.constraints.values()]
+            low, high = max(counts, default=0), sum(counts)
+            if remaining > high and remaining - low < unresolved - frontier:
+                return False
+
+        found = len(self.safe) + len(self.mines)
+        if remaining == 0 or remaining == unresolved:
+            self.resolve(self.unresolved_cells(), remaining > 0, work)
+            return len(self.safe) + len(self.mines) > found
+
+        groups = [
+            [self.constraints[k] for k in group]
+            for group in self.components(self.constraints)
+        ]
+        tables = [self.table(rows) for rows in groups]
+        if any(table is None for table in tables):
+            # too large to enumerate, eliminate with the count as a row
+            rows = list(self.constraints.values())
+            cells = self.unresolved_cells()
+            mines, safe = eliminate(rows + [(cells, remaining)])
+            self.resolve(mines, True, work)
+            self.resolve(safe, False, work)
+            return len(self.safe) + len(self.mines) > found
+
+        # before[i][k] - T/F if the first i groups can hold k mines together,
+        # after[i][k] the same for groups i onwards
+        feasible = [ways > 0 for _, ways, _ in tables]
+        before = [np.ones(1, dtype=bool)]
+        for f in feasible:
+            before.append(np.convolve(before[-1], f) > 0)
+        after = [np.ones(1, dtype=bool)]
+        for f in reversed(feasible):
+            after.append(np.convolve(after[-1], f) > 0)
+        after.reverse()
+
+        interior = unresolved - sum(len(order) for order, _, _ in tables)
+        for i, (order, ways, mine_ways) in enumerate(tables):
+            others = np.convolve(before[i], after[i + 1]) > 0
+            k = np.arange(ways.size)
+            allowed = feasible[i] & reachable(
+                others, remaining - k - interior, remaining - k
+            )
+            mines, safe = settle(order, ways, mine_ways, allowed)
+            self.resolve(mines, True, work)
+            self.resolve(safe, False, work)
+
+        if interior > 0:
+            total = before[-1]
+            if not reachable(total, remaining - interior, remaining - 1):
+                self.resolve(self.unresolved_cells(interior=True), False, work)
+            elif not reachable(total, remaining - interior + 1, remaining):
+                self.resolve(self.unresolved_cells(interior=True), True, work)
+        return len(self.safe) + len(self.mines) > found
+
+    def unresolved_cells(self, interior=False):
+        """
+        The unrevealed squares not yet proven safe or a mine
+        Args:
+            interior - T/F if only squares in no constraint are returned
+        Returns:
+            A set of (x, y) squares
+        """
+        cells = {(int(x), int(y)) for x, y in np.argwhere(~self.known)}
+        cells -= self.safe | self.mines
+        if interior:
+            cells = {c for c in cells if not self.cell_constraints.get(c)}
+        return cells
+
+
+def settle(order, ways, mine_ways, allowed):
+    """
+    Find the squares of a counted group that are safe (or a mine) in every
+    configuration with an allowed number of mines
+    Args:
+        order - the group's squares
+        ways, mine_ways - see probability.enumerate_component
+        allowed - T/F per number of mines
+    Returns:
+        A tuple of the lists (mines, safe) of (x, y) squares
+    """
+    if not allowed.any():  # inconsistent board
+        return [], []
+    ways, mine_ways = ways[allowed], mine_ways[allowed]
+    safe = (mine_ways == 0).all(axis=0)
+    mines = (mine_ways >= ways[:, None] * (1 - 1e-9)).all(axis=0)
+    return (
+        [order[c] for c in np.flatnonzero(mines)],
+        [order[c] for c in np.flatnonzero(safe)],
+    )
+
+
+def reachable(totals, low, high):
+    """
+    Check which ranges of mine totals contain a possible one
+    Args:
+        totals - T/F per number of mines if it is possible
+        low, high - the ranges' inclusive bounds, numbers or arrays
+    Returns:
+        T/F per range if some total in it is possible
+    """
+    counts = np.concatenate([[0], np.cumsum(totals)])
+    low = np.clip(low, 0, totals.size)
+    high = np.clip(np.asarray(high) + 1, 0, totals.size)
+    return counts[np.maximum(high, low)] > counts[low]
+
+
+def eliminate(rows):
+    """
+    Reduce a group of constraints to row echelon form, then apply bound
+    reasoning to each row: if a row only balances with all its positive
+    squares being mines and all its negative squares safe (or the
+    reverse), they must be
+    Args:
+        rows - list of (cells, remaining) constraints
+    Returns:
+        A tuple of the lists (mines, safe) of (x, y) squares
+    """
+    cells = sorted(set().union(*(c for c, _ in rows)))
+    if not cells:
+        return [], []
+    column = {cell: j for j, cell in enumerate(cells)}
+    system = np.zeros((len(rows), len(cells) + 1))
+    for i, (row_cells, remaining) in enumerate(rows):
+        system[i, [column[c] for c in row_cells]] = 1
+        system[i, -1] = remaining
+    system = row_echelon(system)
+
+    mines, safe = set(), set()
+    for row in system:
+        coefs, total = row[:-1], row[-1]
+        positive, negative = coefs > 1e-9, coefs < -1e-9
+        if abs(total - coefs[positive].sum()) < 1e-9:
+            mines.update(np.flatnonzero(positive).tolist())
+            safe.update(np.flatnonzero(negative).tolist())
+        elif abs(total - coefs[negative].sum()) < 1e-9:
+            safe.update(np.flatnonzero(positive).tolist())
+            mines.update(np.flatnonzero(negative).tolist())
+    return [cells[j] for j in mines], [cells[j] for j in safe]
+
+
+def row_echelon(system):
+    """
+    Gauss-Jordan elimination with partial pivoting
+    Args:
+        system - augmented matrix [A | b], modified in place
+    Returns:
+        The nonzero rows of the reduced matrix
+    """
+    rows, cols = system.shape
+    r = 0
+    for c in range(cols - 1):
+        pivot = r + int(np.argmax(np.abs(system[r:, c])))
+        if abs(system[pivot, c]) < 1e-9:
+            continue
+        system[[r, pivot]] = system[[pivot, r]]
+        system[r] /= system[r, c]
+        factors = system[:, c].copy()
+        factors[r] = 0
+        system -= np.outer(factors, system[r])
+        r += 1
+        if r == rows:
+            break
+    return system[:r]
@@ -1,48 +1,91 @@
 import pygame
 import os
 
+SPRITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sprites")
 
-def load_images():
+IMAGE_NAMES = [
+    "empty",
+    "one",
+    "two",
+    "three",
+    "four",
+    "five",
+    "six",
+    "seven",
+    "eight",
+    "block",
+    "flagged",
+    "mine",
+    "minesweep",
+]
+
+
+class SpriteAtlas:
+    def __init__(self, sprite_dir=SPRITE_DIR):
+        """
+        Cache of the game's images, loaded from disk once and scaled
+        once per block size
+        Args:
+            sprite_dir - folder holding the sprite pngs
+        """
+        self.sprite_dir = sprite_dir
+        self.originals = None
+        self.scaled = {}
+
+    def load(self):
+        """
+        Load the original images from disk, if not loaded yet
+        Args:
+            None
+        Returns:
+            A dictionary mapping image names to pygame images
+        """
+        if self.originals is None:
+            self.originals = {
+                im: pygame.image.load(os.path.join(self.sprite_dir, f"{im}.png"))
+                for im in IMAGE_NAMES
+            }
+        return self.originals
+
+    def get(self, block_size):
+        """
+        Get every image scaled to block_size, converted to the display's
+        pixel format when there is a display so blits don't convert
+        Args:
+            block_size - the size of an individual block in pixels
+        Returns:
+            A dictionary containing all images, see load_images
+        """
+        converted = pygame.display.get_surface() is not None
+        key = (block_size, converted)
+        if key not in self.scaled:
+            imgs = {}
+            imgs["nums"] = []
+            for i, (im, image) in enumerate(self.load().items()):
+                image = pygame.transform.scale(image, (block_size, block_size))
+                if converted:
+                    if image.get_flags() & pygame.SRCALPHA:
+                        image = image.convert_alpha()
+                    else:
+                        image = image.convert()
+                if i <= 8:  # handle 0-8 cases
+                    imgs["nums"].append(image)
+                else:
+                    imgs[im] = image
+            self.scaled[key] = imgs
+        return self.scaled[key]
+
+
+atlas = SpriteAtlas()
+
+
+def load_images(block_size=120):
     """
-    Load in images as pygame images
+    Load in images as pygame images, scaled to block_size
+    Images are cached, so repeated calls are free
     Args:
-        None
+        block_size - the size of an individual block in pixels
     Returns:
         A dictionary containing all images
     """
-    image_names = [
-        "empty",
-        "one",
-        "two",
-        "three",
-        "four",
-        "five",
-        "six",
-        "seven",
-        "eight",
-        "block",
-        "flagged",
-        "mine",
-        "minesweep",
-    ]
-    imgs = {}
-    imgs["nums"] = []
-    # icon = pygame.image.load('sprites/minesweep.png')
-    for i, im in enumerate(image_names):
-        if i <= 8:  # handle 0-8 cases
-            imgs["nums"].append(format(pygame.image.load(f"sprites/{im}.png")))
-        else:
-            imgs[im] = format(pygame.image.load(f"sprites/{im}.png"))
-
-    return imgs
-
-
-def format(image):
-    """
-    Helper function to resize images
-    Args:
-        image - the image to resize
-    Returns:
-        The resized image
-    """
-    return pygame.transform.scale(image, (120, 120))
+    return atlas.get(block_size)
@@ -0,0 +1,227 @@
+import numpy as np
+from game import NEIGHBOR_DX, NEIGHBOR_DY
+from encoding import encode_states
+
+
+class VecMinesweeper:
+    """
+    A batch of B Minesweeper games held as (B, n, n) arrays and stepped together
+    Rewards follow the same shaping as Minesweeper.play, and boards that
+    finish are reset automatically so every step returns a full batch
+    Board Representation:
+    0 <= n <= 8 if a square is revealed and has n neighbors
+    -1 if a square is unrevealed (mines are only stored in the mine mask,
+    there are no flags)
+    Args:
+        num_boards - the number of boards B
+        n - the size of each board (n x n)
+        mine_cnt - the number of mines on each board
+        rng - optional numpy.random.Generator used to place mines
+    """
+
+    def __init__(self, num_boards, n, mine_cnt, rng=None):
+        self.num_boards = num_boards
+        self.n = n
+        self.mines = mine_cnt
+        self.safe_cnt = n**2 - mine_cnt
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        shape = (num_boards, n, n)
+        self.board = np.full(shape, -1, dtype=np.int8)
+        self.mine = np.zeros(shape, dtype=bool)
+        self.revealed = np.zeros(shape, dtype=bool)
+        self.adjacent = np.zeros(shape, dtype=np.int8)
+        self.revealed_cnt = np.zeros(num_boards, dtype=np.int64)
+        self.first_click = np.ones(num_boards, dtype=bool)
+
+    def reset(self, boards=None):
+        """
+        Reset boards to their initial state
+        Args:
+            boards - boolean mask or indices of the boards to reset, all if None
+        Returns:
+            Nothing
+        """
+        if boards is None:
+            boards = slice(None)
+        self.board[boards] = -1
+        self.mine[boards] = False
+        self.revealed[boards] = False
+        self.adjacent[boards] = 0
+        self.revealed_cnt[boards] = 0
+        self.first_click[boards] = True
+
+    def place_mines(self, boards, xs, ys):
+        """
+        Place mines on several boards at once, keeping each first click safe
+        Args:
+            boards - indices of the boards to place mines on
+            xs - the x index of each board's first click
+            ys - the y index of each board's first click
+        Returns:
+            Nothing
+        """
+        n = self.n
+        # a random key per square, taking the mine_cnt smallest keys samples
+        # squares without replacement
+        keys = self.rng.random((boards.size, n * n))
+
+        # ensuring that you can't insta-lose
+        rows = xs[:, None] + np.append(NEIGHBOR_DX, 0)
+        cols = ys[:, None] + np.append(NEIGHBOR_DY, 0)
+        on_board = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n)
+        owner = np.broadcast_to(np.arange(boards.size)[:, None], rows.shape)
+        keys[owner[on_board], rows[on_board] * n + cols[on_board]] = np.inf
+
+        if self.mines > np.isfinite(keys).sum(axis=1).min():
+            raise ValueError(f"Cannot place {self.mines} mines on a {n}x{n} board")
+        if self.mines > 0:
+            mines_to_place = np.argpartition(keys, self.mines - 1, axis=1)
+            mines_to_place = mines_to_place[:, : self.mines]
+            self.mine.reshape(self.num_boards, -1)[
+                boards[:, None], mines_to_place
+            ] = True
+        self.count_adjacent(boards)
+
+    def count_adjacent(self, boards):
+        """
+        Precompute the number of neighboring mines for every square on the
+        given boards by summing shifted copies of the mine masks
+        Args:
+            boards - indices of the boards to update
+        Returns:
+            Nothing
+        """
+        padded = np.pad(self.mine[boards], ((0, 0), (1, 1), (1, 1)))
+        padded = padded.astype(np.int8)
+        adjacent = -padded[:, 1:-1, 1:-1]  # squares don't neighbor themselves
+        for dx in range(3):
+            for dy in range(3):
+                adjacent += padded[:, dx : dx + self.n, dy : dy + self.n]
+        self.adjacent[boards] = adjacent
+
+    def reveal(self, boards, xs, ys):
+        """
+        Reveal squares on several boards at once, flood filling zero regions
+        one wavefront of flat indices at a time
+        Args:
+            boards - indices of the boards
+            xs - the x index of the square clicked on each board
+            ys - the y index of the square clicked on each board
+        Returns:
+            Nothing
+        """
+        n = self.n
+        # flat views over the whole batch
+        board = self.board.reshape(-1)
+        revealed = self.revealed.reshape(-1)
+        adjacent = self.adjacent.reshape(-1)
+
+        frontier = (boards * n + xs) * n + ys
+        frontier = frontier[board[frontier] == -1]
+        while frontier.size:
+            board[frontier] = adjacent[frontier]
+            revealed[frontier] = True
+            np.add.at(self.revealed_cnt, frontier // (n * n), 1)
+
+            # stop revealing where we've shown information
+            zeros = frontier[adjacent[frontier] == 0]
+            if zeros.size == 0:
+                break
+
+            cells, squares = np.divmod(zeros, n * n)
+            rows, cols = np.divmod(squares, n)
+            rows = rows[:, None] + NEIGHBOR_DX
+            cols = cols[:, None] + NEIGHBOR_DY
+            cells = np.broadcast_to(cells[:, None], rows.shape)
+            on_board = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n)
+            neighbors = (cells[on_board] * n + rows[on_board]) * n + cols[on_board]
+            neighbors = np.unique(neighbors)
+
+            # only reveal an adjacent tile if it's unrevealed
+            frontier = neighbors[board[neighbors] == -1]
+
+    def is_progress(self, boards, xs, ys):
+        """
+        Determine, for each board, whether the safe clear at (x, y) is
+        progress or a random guess
+        Args:
+            boards - indices of the boards
+            xs - the x coordinates
+            ys - the y coordinates
+        Returns:
+            A boolean array, True if progress, False if random guess
+        """
+        padded = np.pad(self.revealed[boards], ((0, 0), (1, 1), (1, 1)))
+        rows = xs[:, None] + 1 + NEIGHBOR_DX
+        cols = ys[:, None] + 1 + NEIGHBOR_DY
+        return padded[np.arange(boards.size)[:, None], rows, cols].any(axis=1)
+
+    def step(self, actions):
+        """
+        Play one action on every board
+        Args:
+            actions - array of B flat actions, x * n + y
+        Returns:
+            a tuple of arrays (rewards, dones, scores), one entry per board
+            boards that finished are reset before returning, scores are taken
+            before the reset
+        """
+        xs, ys = np.divmod(np.asarray(actions, dtype=np.int64), self.n)
+        boards = np.arange(self.num_boards)
+
+        first = self.first_click.copy()
+        if first.any():  # first click has no reward
+            self.place_mines(boards[first], xs[first], ys[first])
+            self.first_click[first] = False
+
+        rewards = np.zeros(self.num_boards, dtype=np.float32)
+        hit = self.mine[boards, xs, ys]
+        nothing = self.revealed[boards, xs, ys]
+        safe = ~(hit | nothing)
+
+        # reward meaningful moves, punish 'guess' moves
+        progress = self.is_progress(boards[safe], xs[safe], ys[safe])
+        rewards[safe] = np.where(progress, 0.3, -0.3)
+        rewards[hit] = -2  # game over, loss
+        rewards[nothing] = -0.1  # punish "nothing" moves
+        self.reveal(boards[safe], xs[safe], ys[safe])
+
+        scores = self.revealed_cnt.copy()
+        won = scores == self.safe_cnt
+        rewards[won] = 1  # game over, win
+        dones = hit | won
+
+        if dones.any():
+            self.reset(dones)
+        return rewards, dones, scores
+
+    def action_mask(self):
+        """
+        Flags which squares are worth clicking on each board
+        Args:
+            None
+        Returns:
+            A (B, n**2) boolean array, indexed by x * n + y
+        """
+        return ~self.revealed.reshape(self.num_boards, -1)
+
+    def get_states(self):
+        """
+        Get the current state of every board, laid out like Agent.get_state
+        Args:
+            None
+        Returns:
+            A (B, n**2) array of boards, each flattened in column-major order
+        """
+        return self.board.transpose(0, 2, 1).reshape(self.num_boards, -1)
+
+    def get_onehot_states(self, out=None):
+        """
+        One-hot encode every board in a single call, see encoding.py
+        Args:
+            out - optional preallocated (B, C, n, n) boolean array to write into
+        Returns:
+            A (B, C, n, n) boolean array
+        """
+        return encode_states(self.board, out=out)